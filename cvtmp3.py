@@ -1,69 +1,131 @@
-from glob import glob 
+"""
+mp3 -> audio converter.
+
+Files are decoded in a process pool (librosa.load / sf.write hold the GIL
+for a good part of the work, so threads did not scale), submitted in
+chunks. Every converted file is written through a .part file +
+os.replace and appended to a manifest (``{wav_dir}/.converted``: source,
+output, sample rate, frames), so an interrupted run resumes where it
+stopped.
+
+    python3 cvtmp3.py --mp3_dir='mp3 dir' --wav_dir='wav dir' --num_workers=16 --format=flac --sr=32000
+
+Formats: wav (PCM16), flac (PCM16, about half the size), npy (mono
+float16, for np.load(mmap_mode='r'); the sample rate is in the
+manifest). --sr resamples once here (e.g. 32000 for passot) so later
+loads need no resampling; by default the native rate is kept.
+"""
+from glob import glob
 import soundfile as sf
-import librosa, os 
-from tqdm import tqdm 
+import numpy as np
+import librosa, os
+from tqdm import tqdm
 from argparse import ArgumentParser
 import concurrent.futures
 from pathlib import Path
-def convert_mp3_to_wav(mp3_path, wav_dir):
-    """Convert a single MP3 file to WAV format"""
+
+EXTENSIONS = {'wav': '.wav', 'flac': '.flac', 'npy': '.npy'}
+
+
+def output_path(mp3_path, wav_dir, fmt='wav'):
+    return os.path.join(wav_dir, Path(mp3_path).stem + EXTENSIONS[fmt])
+
+
+def convert_mp3_to_wav(mp3_path, wav_dir, fmt='wav', sr=None, delete=True):
+    """
+    Convert a single MP3 file.
+
+    Returns:
+        (True, mp3_path, output path, sample rate, frames) or (False, mp3_path, error, None, 0)
+    """
     try:
-        name = Path(mp3_path).stem
-        y, sr = librosa.load(mp3_path, sr=None)
-        sf.write(f'{wav_dir}/{name}.wav', y, sr)
-        os.remove(mp3_path)
-        return True, mp3_path
+        y, sr = librosa.load(mp3_path, sr=sr)
+        out = output_path(mp3_path, wav_dir, fmt)
+        tmp = f'{out}.part'
+        if fmt == 'npy':
+            with open(tmp, 'wb') as f:
+                np.save(f, y.astype(np.float16))
+        else:
+            sf.write(tmp, y, sr, format=fmt.upper(), subtype='PCM_16')
+        os.replace(tmp, out)
+        if delete:
+            os.remove(mp3_path)
+        return True, mp3_path, out, sr, len(y)
     except Exception as e:
-        return False, mp3_path
+        return False, mp3_path, f'{type(e).__name__}: {e}', None, 0
+
+
+def _convert(job):
+    return convert_mp3_to_wav(*job)
+
+
+def load_manifest(path):
+    """sources already converted according to the manifest"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.split('\t')[0] for line in f if line.strip()}
+
+
+def convert(mp3_files, wav_dir, fmt='wav', sr=None, delete=True, num_workers=1, chunksize=16):
+    """
+    Convert mp3_files into wav_dir, skipping those in the manifest or whose output exists.
+
+    Returns:
+        dict: converted / skipped counts, failed (path -> error)
+    """
+    os.makedirs(wav_dir, exist_ok=True)
+    manifest = os.path.join(wav_dir, '.converted')
+    done = load_manifest(manifest)
+    pending = [p for p in mp3_files if p not in done and not os.path.exists(output_path(p, wav_dir, fmt))]
+    skipped = len(mp3_files) - len(pending)
+    jobs = [(p, wav_dir, fmt, sr, delete) for p in pending]
+    print(f"Found {len(mp3_files)} MP3 files, {skipped} already converted")
+
+    converted, failed = 0, {}
+    if num_workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(num_workers)
+        # chunksize 개씩 묶어서 보내므로 file 마다 IPC 를 하지 않음
+        results = executor.map(_convert, jobs, chunksize=chunksize)
+    else:
+        executor = None
+        results = map(_convert, jobs)
+    try:
+        with open(manifest, 'a', encoding='utf-8') as log:
+            for success, file_path, out, rate, frames in tqdm(results, total=len(jobs), desc="Converting files"):
+                if success:
+                    converted += 1
+                    log.write(f'{file_path}\t{out}\t{rate}\t{frames}\n')
+                    log.flush()
+                else:
+                    failed[file_path] = out
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return {'converted': converted, 'skipped': skipped, 'failed': failed}
+
 
 def get_args():
     parser = ArgumentParser()
     parser.add_argument('--mp3_dir', type=str)
     parser.add_argument('--wav_dir', type=str)
-    parser.add_argument('--num_threads', type=int, default=1, help='Number of threads to use')
+    parser.add_argument('--num_workers', '--num_threads', type=int, default=1, help='Number of processes to use')
+    parser.add_argument('--format', choices=list(EXTENSIONS), default='wav', help='wav / flac (PCM16) or npy (float16)')
+    parser.add_argument('--sr', type=int, default=None, help='resample to this rate (default: keep the native rate)')
+    parser.add_argument('--keep_mp3', action='store_true', help='do not delete converted mp3 files')
+    parser.add_argument('--chunksize', type=int, default=16, help='files sent to a worker at a time')
     args = parser.parse_args()
     return args
 
 if __name__ == "__main__":
     args = get_args()
-    mp3_dir = args.mp3_dir
-    wav_dir = args.wav_dir
-    num_threads = args.num_threads
-    
-    # Create output directory if it doesn't exist
-    if not os.path.exists(wav_dir):
-        os.makedirs(wav_dir)
-    
-    # Get all MP3 files
-    mp3_files = glob(f'{mp3_dir}/*.mp3')
-    total_files = len(mp3_files)
-    print(f"Found {total_files} MP3 files")
-
-
-    # Initialize counters
-    success_count = 0
-    fail_count = 0
-    
-    # Process files using thread pool
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-        # Submit all tasks
-        future_to_file = {
-            executor.submit(convert_mp3_to_wav, mp3_path, wav_dir): mp3_path 
-            for mp3_path in mp3_files
-        }
-        
-        # Process completed tasks with progress bar
-        with tqdm(total=total_files, desc="Converting files") as pbar:
-            for future in concurrent.futures.as_completed(future_to_file):
-                success, file_path = future.result()
-                if success:
-                    success_count += 1
-                else:
-                    fail_count += 1
-                    print(f"\nFailed to convert: {file_path}")
-                pbar.update(1)
-    
+    mp3_files = sorted(glob(f'{args.mp3_dir}/*.mp3'))
+    stats = convert(mp3_files, args.wav_dir, args.format, args.sr, not args.keep_mp3, args.num_workers, args.chunksize)
+
     print(f"\nConversion complete:")
-    print(f"Total files: {total_files}")
-    print(f"Successful conversions: {success_count}")
-    print(f"Failed conversions: {fail_count}")
\ No newline at end of file
+    print(f"Total files: {len(mp3_files)}")
+    print(f"Successful conversions: {stats['converted']}")
+    print(f"Skipped (already converted): {stats['skipped']}")
+    print(f"Failed conversions: {len(stats['failed'])}")
+    for file_path, error in list(stats['failed'].items())[:5]:
+        print(f"  {file_path} : {error}")
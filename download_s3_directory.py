@@ -4,6 +4,7 @@ import os
 import boto3
 from tqdm import tqdm
 import math
+from s3_download import Downloader
 
 
 def get_args():
@@ -16,6 +17,7 @@ def get_args():
                         help="샘플링 방식: full(전체 목록), efficient(효율적 샘플링)")
     parser.add_argument("--exclude_subfolders", action="store_true",
                         help="하위 폴더를 제외하고 상위 경로 파일만 다운로드")
+    parser.add_argument("--workers", type=int, default=32, help="동시 다운로드 개수")
     return parser.parse_args()
 
 
@@ -155,16 +157,14 @@ def list_s3_files(bucket_name, prefix, exclude_subfolders=False):
     return keys
 
 
-def download_files(bucket_name, keys, dst_dir):
-    """주어진 keys 목록의 파일을 모두 dst_dir 로 다운로드합니다."""
-    s3 = boto3.client("s3")
+def download_files(bucket_name, keys, dst_dir, workers=32):
+    """주어진 keys 목록의 파일을 모두 dst_dir 로 병렬 다운로드합니다 (중단되면 이어받기)."""
     os.makedirs(dst_dir, exist_ok=True)
 
     print(f"총 {len(keys)}개 파일 다운로드 시작...")
-    for key in tqdm(keys, desc="다운로드 진행률"):
-        filename = os.path.basename(key)
-        local_path = os.path.join(dst_dir, filename)
-        s3.download_file(bucket_name, key, local_path)
+    downloader = Downloader(bucket_name, workers=workers, manifest=os.path.join(dst_dir, ".downloaded"))
+    jobs = [(key, os.path.join(dst_dir, os.path.basename(key))) for key in keys]
+    return downloader.download(jobs, desc="다운로드 진행률")
 
 
 def main():
@@ -197,7 +197,7 @@ def main():
         return
 
     print(f"{len(selected_keys):,}개 파일을 다운로드합니다...")
-    download_files(args.bucket, selected_keys, args.dst)
+    download_files(args.bucket, selected_keys, args.dst, args.workers)
     print("다운로드가 완료되었습니다.")
 
 
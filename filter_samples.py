@@ -1,69 +1,41 @@
 import os
-import librosa
-import numpy as np
 from tqdm import tqdm
 from argparse import ArgumentParser
 import multiprocessing as mp
-from functools import partial
+from validation import is_valid_audio, materialize, audio_files
 
 def get_args():
     parser = ArgumentParser()
     parser.add_argument('--samples_dir', type=str)
     parser.add_argument('--output_dir', type=str)
     parser.add_argument('--num_workers', type=int, default=None, help='Number of worker processes. Default: number of CPU cores')
+    parser.add_argument('--min_rms', type=float, default=0.01)
+    parser.add_argument('--mode', choices=['link','copy','move'], default='link', help='how valid files are put in output_dir')
     args = parser.parse_args()
     return args
 
-def is_valid_audio(file_path, min_duration=0.1, min_rms=0.01):
-    """
-    Check if an audio file is valid:
-    - Not too short (default: > 0.1 seconds)
-    - Has actual sound (default: RMS > 0.01)
-    """
-    try:
-        # Load audio file
-        y, sr = librosa.load(file_path)
-        
-        # Check duration
-        duration = librosa.get_duration(y=y, sr=sr)
-        if duration < min_duration:
-            return False, "Too short"
-        
-        # Check if there's actual sound
-        rms = librosa.feature.rms(y=y)[0]
-        if np.max(rms) < min_rms:
-            return False, "No sound"
-            
-        return True, "Valid"
-    except Exception as e:
-        return False, f"Error: {str(e)}"
-
 def process_file(args):
-    wav_file, output_dir, min_duration = args
-    is_valid, reason = is_valid_audio(wav_file, min_duration=min_duration)
+    wav_file, output_dir, min_duration, min_rms, mode = args
+    is_valid, reason = is_valid_audio(wav_file, min_duration=min_duration, min_rms=min_rms)
     
     if is_valid:
-        # Copy valid file to output directory
+        # Link (or copy) valid file to output directory
         filename = os.path.basename(wav_file)
         new_path = os.path.join(output_dir, filename)
-        os.system(f'cp "{wav_file}" "{new_path}"')
+        materialize(wav_file, new_path, mode)
         return True, filename, reason
     else:
         return False, os.path.basename(wav_file), reason
 
-def filter_samples(samples_dir, output_dir, min_duration=0.1, num_workers=None):
-    # Get all wav files
-    wav_files = []
-    for root, dirs, files in os.walk(samples_dir):
-        for file in files:
-            if file.endswith('.wav'):
-                wav_files.append(os.path.join(root, file))
+def filter_samples(samples_dir, output_dir, min_duration=0.1, num_workers=None, min_rms=0.01, mode='link'):
+    # Get all wav / flac files
+    wav_files = audio_files(samples_dir)
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
     # Prepare arguments for parallel processing
-    process_args = [(wav_file, output_dir, min_duration) for wav_file in wav_files]
+    process_args = [(wav_file, output_dir, min_duration, min_rms, mode) for wav_file in wav_files]
     
     # Set up multiprocessing pool
     if num_workers is None:
@@ -74,7 +46,7 @@ def filter_samples(samples_dir, output_dir, min_duration=0.1, num_workers=None):
     # Process files in parallel
     with mp.Pool(num_workers) as pool:
         results = list(tqdm(
-            pool.imap(process_file, process_args),
+            pool.imap(process_file, process_args, chunksize=16),
             total=len(wav_files),
             desc="Processing files"
         ))
@@ -94,5 +66,6 @@ def filter_samples(samples_dir, output_dir, min_duration=0.1, num_workers=None):
 
 if __name__ == "__main__":
     args = get_args()
-    filter_samples(args.samples_dir, args.output_dir, min_duration=0.5, num_workers=args.num_workers)
+    filter_samples(args.samples_dir, args.output_dir, min_duration=0.5, num_workers=args.num_workers,
+                   min_rms=args.min_rms, mode=args.mode)
     
@@ -1,37 +1,26 @@
 import pickle
 from glob import glob
-import json
-from tqdm import tqdm
+from vector.metastore import MetaStore
 
-def find_meta(names):
-    global metas
-    count = 0
+def find_meta(names, store, k=10):
+    """(position in names, original sample name) of the first k names found in the store"""
+    found = store.lookup(names)
     result = []
-    db = {}
     for i, id in enumerate(names):
-        db[id] = i
-
-    for meta in tqdm(metas,desc='searching meta on ..'):
-        data = meta['samples']
-        for idx, sample in tqdm(enumerate(data),desc='searching sample on temp json'):
-            if sample['uuid'] in names:
-                name = sample['name'].split('/')[-1].split('.')[0]
-                result.append((db[sample['uuid']],name))
-                count+=1
-                if count == 10:
-                    result.sort()
-                    return result
-
-    return False
+        if id in found:
+            name = found[id]['name'].split('/')[-1].split('.')[0]
+            result.append((i,name))
+            if len(result) == k:
+                break
+    return result if result else False
 
 if __name__ == '__main__':
     with open('fastforward.pkl','rb') as f:
         names = pickle.load(f)
 
-    paths  = glob('meta/*.json')
-    metas = []
-    for path in tqdm(paths,desc='loading json files'):
-        with open(path,'r',encoding='utf-8') as f:
-            metas.append(json.load(f))
+    # meta/*.json 은 처음 한 번만 sqlite 로 옮김, 끝까지 commit 된 build 가 없으면 다시
+    store = MetaStore('meta.db')
+    if not store.built:
+        store.build(glob('meta/*.json'))
 
-    print(find_meta(names))
\ No newline at end of file
+    print(find_meta(names,store))
@@ -0,0 +1,107 @@
+"""
+One pass ingestion: convert, validate and extract features while decoding every file once.
+
+    python3 ingest.py --src_dir='mp3 dir' --wav_dir='wav dir' --method=all --feature_store='features.db'
+    python3 initialize.py --db_dir='wav dir' --weights='weights dir' --method=all --feature_store='features.db'
+
+replaces cvtmp3.py + filter_samples.py + the decoding done by initialize.py
+(the second command only hashes the wavs and reads the store). With
+--weights the indexes are built right away. --wav_dir is required when
+src_dir holds mp3s (their features are keyed by the hash of the written
+wav). Files rejected by decode / validate are listed in
+``{wav_dir or src_dir}/.rejected`` and skipped by the next run.
+"""
+import os
+from collections import Counter
+from glob import glob
+from argparse import ArgumentParser
+import torch
+from vector import VanlillaDB, NNDB, FeatureStore
+from vector.pipeline import Pipeline, ingest_stages
+from cvtmp3 import load_manifest
+
+# 이 stage 에서 떨어진 파일은 다시 돌려도 같으므로 manifest 에 남김
+REJECT_STAGES = ('decode', 'validate')
+
+
+def get_args():
+    parser = ArgumentParser()
+    parser.add_argument('--src_dir', type=str, help='mp3 / wav / flac files to ingest')
+    parser.add_argument('--wav_dir', type=str, default=None, help='write valid samples here as wav (default: keep them in src_dir, wav / flac sources only)')
+    parser.add_argument('--method', choices=['all','fft','mfcc','attack','passot'], default='all')
+    parser.add_argument('--feature_store', type=str, help='sqlite feature store the features go to')
+    parser.add_argument('--weights', type=str, default=None, help='build the index(es) from the store afterwards')
+    parser.add_argument('--min_duration', type=float, default=0.5)
+    parser.add_argument('--min_rms', type=float, default=0.01)
+    parser.add_argument('--max_seconds', type=int, default=10, help='leading seconds embedded by PaSST')
+    parser.add_argument('--delete_source', action='store_true', help='remove each mp3 once its wav is written')
+    parser.add_argument('--read_workers', type=int, default=2)
+    parser.add_argument('--decode_workers', type=int, default=4)
+    parser.add_argument('--extract_workers', type=int, default=4)
+    parser.add_argument('--batch_size', type=int, default=16, help='PaSST batch / store transaction size')
+    parser.add_argument('--queue_size', type=int, default=32, help='items buffered between two stages')
+    args = parser.parse_args()
+    return args
+
+
+def sources(src_dir, wav_dir=None, rejected=()):
+    """mp3 / wav / flac files of src_dir, without those already written to wav_dir or rejected before"""
+    paths = sorted(glob(f'{src_dir}/*.mp3') + glob(f'{src_dir}/*.wav') + glob(f'{src_dir}/*.flac'))
+    paths = [p for p in paths if p not in rejected]
+    if wav_dir is None:
+        return paths
+    return [p for p in paths if not os.path.exists(os.path.join(wav_dir, f'{os.path.splitext(os.path.basename(p))[0]}.wav'))]
+
+
+def record_rejects(path, failed):
+    """append the decode / validate failures to the rejects manifest"""
+    with open(path, 'a', encoding='utf-8') as f:
+        for source, (stage, reason) in failed.items():
+            if stage in REJECT_STAGES:
+                reason = ' '.join(reason.split())
+                f.write(f'{source}\t{stage}\t{reason}\n')
+
+
+if __name__ == '__main__':
+    args = get_args()
+    if args.wav_dir is None and glob(f'{args.src_dir}/*.mp3'):
+        # mp3 의 feature 는 쓰여진 wav 의 hash 로 저장되므로 wav 가 없으면 initialize 가 찾을 수 없음
+        raise SystemExit('--wav_dir is required when --src_dir holds mp3 files')
+    methods = ['fft','mfcc','passot'] if args.method == 'all' else [args.method]
+    store = FeatureStore(args.feature_store)
+    model, device = None, torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+    if 'passot' in methods:
+        from hear21passt.base import get_basic_model
+        model = get_basic_model(mode='embed_only').eval().to(device)
+    if args.wav_dir is not None:
+        os.makedirs(args.wav_dir, exist_ok=True)
+
+    rejects = os.path.join(args.wav_dir or args.src_dir, '.rejected')
+    rejected = load_manifest(rejects)
+    paths = sources(args.src_dir, args.wav_dir, rejected)
+    workers = {'read': args.read_workers, 'decode': args.decode_workers, 'extract': args.extract_workers}
+    stages = ingest_stages(methods, store, args.wav_dir, model, device, args.max_seconds, args.min_duration,
+                           args.min_rms, args.delete_source, workers, args.batch_size)
+    stats = Pipeline(stages, args.queue_size).run(({'path': path} for path in paths), len(paths))
+    record_rejects(rejects, stats['failed'])
+
+    if rejected:
+        print(f'skipped {len(rejected)} files rejected by an earlier run ({rejects})')
+    print(f"total : {len(paths)}, done : {len(stats['outputs'])}, fail : {len(stats['failed'])}, "
+          f"{len(paths) / max(stats['seconds'], 1e-6):.1f} files/s")
+    for (stage, reason), count in Counter(stats['failed'].values()).most_common(5):
+        print(f'  {count} x {stage} : {reason}')
+    errors = Counter((m, r) for item in stats['outputs'] for m, r in item.get('errors', {}).items())
+    for (method, reason), count in errors.most_common(5):
+        print(f'  {count} x {method} : {reason}')
+    # 가장 오래 걸린 stage 의 worker 를 늘리면 됨
+    print('busy seconds :', {name: round(sec, 1) for name, sec in stats['busy'].items()})
+
+    if args.weights is not None:
+        db_dir = args.wav_dir or args.src_dir
+        for method in methods:
+            weights = args.weights if len(methods) == 1 else f'{args.weights}_{method}'
+            if method == 'passot':
+                NNDB(db_dir, weights=weights, max_seconds=args.max_seconds, store=store)
+            else:
+                VanlillaDB(db_dir, weights=weights, method=method, store=store)
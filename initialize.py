@@ -1,26 +1,98 @@
-from vector import VanlillaDB, NNDB
+from vector import VanlillaDB, NNDB, FeatureStore, PCMArena, open_arena, list_audio
+from vector.shard import ShardSpec, shard_weights, align_stats, collections_from_meta
+from vector.arena import compatible
+import os
+from glob import glob
 from argparse import ArgumentParser
 
 def get_args():
     parser = ArgumentParser()
     parser.add_argument('--db_dir', type=str)
     parser.add_argument('--weights', type=str) 
-    parser.add_argument('--method', choices=['all','fft','mfcc','passot'])
+    parser.add_argument('--method', choices=['all','fft','mfcc','attack','passot'])
+    parser.add_argument('--ann', choices=['ivf'], default=None, help='ann index to build for passot embeddings')
+    parser.add_argument('--nlist', type=int, default=1024, help='number of ivf lists')
+    parser.add_argument('--nprobe', type=int, default=8, help='default number of ivf lists probed per query')
+    parser.add_argument('--pq_m', type=int, default=None, help='pq sub-spaces (bytes per embedding), e.g. 128')
+    parser.add_argument('--workers', type=int, default=1, help='feature extraction processes (fft/mfcc) / audio loader workers (passot)')
+    parser.add_argument('--update', action='store_true', help='incrementally add/delete files of an existing index')
+    parser.add_argument('--feature_store', type=str, default=None, help='sqlite file of extracted features shared by every build')
+    parser.add_argument('--num_shards', type=int, default=1, help='split the library into this many shard indexes ({weights}_shard{i})')
+    parser.add_argument('--shard', type=int, default=None, help='build only this shard (default: all of them)')
+    parser.add_argument('--align_only', action='store_true', help='only align the min/max of all --num_shards fft/mfcc/attack shards (run once after building them with --shard i)')
+    parser.add_argument('--shard_by', choices=['hash','collection'], default='hash')
+    parser.add_argument('--meta', type=str, default='meta/*.json', help='samples_meta json files, used by --shard_by=collection and --attributes')
+    parser.add_argument('--attributes', action='store_true', help='build attributes.npz from --meta for filtered search')
+    parser.add_argument('--arena', type=str, default=None, help='decoded audio cache dir, built / updated from db_dir and read by every method')
+    parser.add_argument('--arena_sr', type=int, default=None, help='arena sample rate (default: native rate of each file), only 32000 with --method=passot or 22050 with attack')
+    parser.add_argument('--compact_ratio', type=float, default=0.25, help='compact once this fraction of rows is deleted')
     args = parser.parse_args()
     return args
 
+def build(args, method, weights, store=None, shard=None, arena=None):
+    if method == 'passot':
+        db = NNDB(args.db_dir,weights=weights,ann=args.ann,nlist=args.nlist,nprobe=args.nprobe,pq_m=args.pq_m,
+                  num_workers=args.workers,store=store,shard=shard,arena=arena)
+    else:
+        db = VanlillaDB(args.db_dir,weights=weights,method=method,workers=args.workers,store=store,shard=shard,arena=arena)
+    if args.update:
+        db.update(compact_ratio=args.compact_ratio)
+    if args.attributes:
+        db.index_attributes(glob(args.meta))
+    return db
+
+def build_shards(args, method, weights, store=None, arena=None):
+    if args.num_shards == 1:
+        return build(args,method,weights,store,arena=arena)
+    collections = collections_from_meta(glob(args.meta)) if args.shard_by == 'collection' else None
+    indices = range(args.num_shards) if args.shard is None else [args.shard]
+    for i in indices:
+        shard = ShardSpec(i,args.num_shards,args.shard_by,collections)
+        build(args,method,shard_weights(weights,i),store,shard,arena)
+    if method != 'passot' and args.shard is None:
+        # shard 마다 min/max 가 다르면 거리 비교가 안 되므로 전체 stats 로 맞춤
+        align_stats([shard_weights(weights,i) for i in indices])
+    elif method != 'passot' and not args.update:
+        # --update 는 shard 의 (맞춰진) min/max 를 그대로 둠
+        print(f'shard {args.shard} keeps its own min/max : run --align_only --num_shards={args.num_shards} '
+              f'once every shard is built, before searching them together')
+
+def align_shards(args, method, weights):
+    if method == 'passot' or args.num_shards == 1:
+        return
+    dirs = [shard_weights(weights,i) for i in range(args.num_shards)]
+    missing = [d for d in dirs if not os.path.exists(d)]
+    if missing:
+        raise SystemExit(f'cannot align {weights}: shards not built yet {missing}')
+    max_val, min_val = align_stats(dirs)
+    print(f'aligned {len(dirs)} shards of {weights}', max_val, min_val)
+
 if __name__ == '__main__':
     args = get_args()
     weights = f'{args.weights}'
-    if args.method == 'all':
-         VanlillaDB(args.db_dir,weights=weights)
-         VanlillaDB(args.db_dir,weights=weights,method='mfcc')
-         NNDB(args.db_dir,weights=weights)
-    elif args.method == 'fft':
-        VanlillaDB(args.db_dir,weights=weights,method='fft')
-    elif args.method == 'mfcc':
-        print('mfcc')
-        VanlillaDB(args.db_dir,weights=weights,method='mfcc')
-    elif args.method == 'passot':
-        NNDB(args.db_dir,weights=weights)
-
+    # 하나의 store 를 공유하면 method 가 달라도 file hash 는 한 번만 계산
+    store = FeatureStore(args.feature_store) if args.feature_store else None
+    arena = None
+    if args.arena and not args.align_only:
+        methods = ['fft','mfcc','passot'] if args.method == 'all' else [args.method]
+        refused = [m for m in methods if not compatible(args.arena_sr, 'float32', m)]
+        if refused:
+            # query 는 file 에서 읽으므로 index 도 같은 signal 로 만들어야 함
+            raise SystemExit(f'--arena_sr={args.arena_sr} changes the signal {refused} extract from, '
+                             f'leave it unset (native rate) for these methods')
+        # 모든 method 가 같은 arena 를 읽으므로 파일은 한 번만 decode
+        arena = open_arena(args.arena)
+        if arena is None or arena.sr != args.arena_sr or arena.dtype != 'float32':
+            arena = PCMArena.build(args.arena,list_audio(args.db_dir),args.arena_sr,'float32',max(args.workers,8))
+        else:
+            arena = arena.update(list_audio(args.db_dir),max(args.workers,8))
+    if args.align_only:
+        methods = ['fft','mfcc'] if args.method == 'all' else [args.method]
+        for method in methods:
+            align_shards(args,method,f'{weights}_{method}' if args.method == 'all' else weights)
+    elif args.method == 'all':
+        # 같은 dir 을 쓰면 index.bin 이 서로 덮어써지므로 method 별로 분리
+        for method in ['fft','mfcc','passot']:
+            build_shards(args,method,f'{weights}_{method}',store,arena)
+    else:
+        build_shards(args,args.method,weights,store,arena)
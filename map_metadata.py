@@ -1,52 +1,185 @@
+import gzip
+import hashlib
 import json
 import os
+import sqlite3
+import struct
+import zlib
+from collections import OrderedDict
 from pathlib import Path
 from typing import Dict, Optional
-import re
+
+# side index 의 schema 가 바뀌면 올려서 예전 index 를 다시 만듦
+INDEX_VERSION = 3
+# .gz meta 는 이 크기 단위로 따로 압축해 둔 block 에서 읽음
+BLOCK_BYTES = 1 << 16
+
 
 class MetadataMapper:
-    def __init__(self, meta_dir: str):
+    def __init__(self, meta_dir: str, index_path: Optional[str] = None, cache_size: int = 1024):
         """Initialize the metadata mapper with a directory containing meta files.
-        
+
+        Records are not loaded up front. A side index (SQLite) maps every wav
+        base name to (file, byte offset, length) of its line; it is built on
+        first use and afterwards only files whose size/mtime changed are
+        re-scanned, so construction is near-instant. Rows are kept per
+        (base name, file), so deleting or re-indexing one file never loses a
+        name another file still has. When several files have the same name
+        the file that sorts last wins (within a file, the last line).
+
+        A gzip stream can only be read from its start, so a .gz meta file is
+        re-compressed at indexing time into independent zlib blocks of about
+        64KB (``<index_path>.blocks``); a lookup then inflates one block
+        instead of the file up to the record.
+
         Args:
             meta_dir: Directory containing the meta files
+            index_path: Side index file (default: <meta_dir>/.metadata_index.sqlite)
+            cache_size: Parsed records kept in an LRU cache (0 disables it)
         """
         self.meta_dir = Path(meta_dir)
-        self.metadata_cache = {}
+        self.index_path = index_path or str(self.meta_dir / '.metadata_index.sqlite')
+        self.blocks_dir = f'{self.index_path}.blocks'
+        self.cache_size = cache_size
+        self.metadata_cache = OrderedDict()
+        self.conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] != INDEX_VERSION:
+            with self.conn:
+                self.conn.execute('DROP TABLE IF EXISTS files')
+                self.conn.execute('DROP TABLE IF EXISTS records')
+                self.conn.execute(f'PRAGMA user_version = {INDEX_VERSION}')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS records '
+                          '(base_name TEXT, path TEXT, block INTEGER, offset INTEGER, length INTEGER, '
+                          'PRIMARY KEY (base_name, path))')
         self._load_metadata()
-    
+
+    @staticmethod
+    def _open(path):
+        return gzip.open(path, 'rb') if str(path).endswith('.gz') else open(path, 'rb')
+
+    def _blocks_path(self, meta_file):
+        name = hashlib.blake2b(meta_file.encode('utf-8'), digest_size=8).hexdigest()
+        return os.path.join(self.blocks_dir, f'{name}.z')
+
     def _load_metadata(self):
-        """Load all metadata files into memory."""
-        for meta_file in self.meta_dir.glob("splice_*_raw.txt*"):
-            try:
-                with open(meta_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        try:
-                            # Each line is a JSON object
-                            data = json.loads(line.strip())
-                            # Extract the base filename without extension
-                            wav_filename = os.path.basename(data.get('wav_file', ''))
-                            base_name = os.path.splitext(wav_filename)[0]
-                            self.metadata_cache[base_name] = data
-                        except json.JSONDecodeError:
-                            continue
-            except Exception as e:
-                print(f"Error loading {meta_file}: {e}")
-                continue
-    
+        """Bring the side index up to date with the meta files."""
+        known = {path: (size, mtime) for path, size, mtime in self.conn.execute('SELECT * FROM files')}
+        on_disk = sorted(str(p) for p in self.meta_dir.glob("splice_*_raw.txt*"))
+        with self.conn:
+            for path in set(known) - set(on_disk):
+                self.conn.execute('DELETE FROM records WHERE path = ?', (path,))
+                self.conn.execute('DELETE FROM files WHERE path = ?', (path,))
+                if os.path.exists(self._blocks_path(path)):
+                    os.remove(self._blocks_path(path))
+            for meta_file in on_disk:
+                st = os.stat(meta_file)
+                if known.get(meta_file) == (st.st_size, st.st_mtime_ns):
+                    continue
+                try:
+                    self._index_file(meta_file)
+                except Exception as e:
+                    print(f"Error loading {meta_file}: {e}")
+                    continue
+                self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)',
+                                  (meta_file, st.st_size, st.st_mtime_ns))
+
+    def _index_file(self, meta_file):
+        self.conn.execute('DELETE FROM records WHERE path = ?', (meta_file,))
+        compressed = meta_file.endswith('.gz')
+        rows, pending, block = [], [], []
+        offset = 0
+        blocks = None
+        if compressed:
+            os.makedirs(self.blocks_dir, exist_ok=True)
+            tmp = f'{self._blocks_path(meta_file)}.part'
+            blocks = open(tmp, 'wb')
+
+        def flush():
+            # block 하나 = 4 byte 길이 + zlib 압축된 line 들
+            nonlocal offset
+            data = zlib.compress(b''.join(block))
+            start = blocks.tell()
+            blocks.write(struct.pack('<I', len(data)) + data)
+            rows.extend((name, meta_file, start, at, length) for name, at, length in pending)
+            pending.clear()
+            block.clear()
+            offset = 0
+
+        try:
+            with self._open(meta_file) as f:
+                for line in f:
+                    # json 으로 읽히는 line 만 index (예전 dict 동작과 같음)
+                    try:
+                        wav_file = json.loads(line.strip()).get('wav_file', '')
+                    except (ValueError, AttributeError):
+                        wav_file = None
+                    if wav_file is not None:
+                        base_name = os.path.splitext(os.path.basename(wav_file))[0]
+                        if compressed:
+                            pending.append((base_name, offset, len(line)))
+                        else:
+                            rows.append((base_name, meta_file, -1, offset, len(line)))
+                    offset += len(line)
+                    if compressed:
+                        block.append(line)
+                        if offset >= BLOCK_BYTES:
+                            flush()
+            if compressed:
+                if block:
+                    flush()
+                blocks.close()
+                os.replace(tmp, self._blocks_path(meta_file))
+        finally:
+            if blocks is not None and not blocks.closed:
+                blocks.close()
+                os.remove(tmp)
+        # 같은 파일에서 같은 이름이 여러 번 나오면 마지막 line 이 남음
+        self.conn.executemany('INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)', rows)
+
+    def _read_record(self, base_name):
+        row = self.conn.execute('SELECT path, block, offset, length FROM records WHERE base_name = ? '
+                                'ORDER BY path DESC LIMIT 1', (base_name,)).fetchone()
+        if row is None:
+            return None
+        path, block, offset, length = row
+        if block < 0:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                line = f.read(length)
+        else:
+            with open(self._blocks_path(path), 'rb') as f:
+                f.seek(block)
+                size, = struct.unpack('<I', f.read(4))
+                line = zlib.decompress(f.read(size))[offset:offset + length]
+        try:
+            return json.loads(line.strip())
+        except json.JSONDecodeError:
+            return None
+
     def get_metadata(self, wav_file_path: str) -> Optional[Dict]:
         """Get metadata for a given WAV file path.
-        
+
+        Only the matching line is read and parsed.
+
         Args:
             wav_file_path: Path to the WAV file
-            
+
         Returns:
             Dictionary containing metadata or None if not found
         """
         # Extract the base filename without extension
         base_name = os.path.splitext(os.path.basename(wav_file_path))[0]
-        return self.metadata_cache.get(base_name)
-    
+        if base_name in self.metadata_cache:
+            self.metadata_cache.move_to_end(base_name)
+            return self.metadata_cache[base_name]
+        metadata = self._read_record(base_name)
+        if metadata is not None and self.cache_size > 0:
+            self.metadata_cache[base_name] = metadata
+            if len(self.metadata_cache) > self.cache_size:
+                self.metadata_cache.popitem(last=False)
+        return metadata
+
     def get_mp3_url(self, wav_file_path: str) -> Optional[str]:
         """Get the MP3 URL for a given WAV file path.
         
@@ -1,9 +1,8 @@
 import os
-import shutil
-import librosa
-import numpy as np
+import multiprocessing as mp
 from tqdm import tqdm
 from argparse import ArgumentParser
+from validation import is_valid_audio, materialize, unique_path, audio_files
 
 def get_args():
     parser = ArgumentParser()
@@ -11,34 +10,15 @@ def get_args():
     parser.add_argument('--dest_dir', type=str)
     parser.add_argument('--min_duration', type=float, default=0.5)
     parser.add_argument('--min_rms', type=float, default=0.05)
+    parser.add_argument('--num_workers', type=int, default=1, help='processes validating files in parallel')
     args = parser.parse_args()
     return args
 
-def is_valid_audio(file_path, min_duration=0.1, min_rms=0.01):
-    """
-    Check if an audio file is valid:
-    - Not too short (default: > 0.1 seconds)
-    - Has actual sound (default: RMS > 0.01)
-    """
-    try:
-        # Load audio file
-        y, sr = librosa.load(file_path)
-        
-        # Check duration
-        duration = librosa.get_duration(y=y, sr=sr)
-        if duration < min_duration:
-            return False, "Too short"
-        
-        # Check if there's actual sound
-        rms = librosa.feature.rms(y=y)[0]
-        if np.max(rms) < min_rms:
-            return False, "No sound"
-            
-        return True, "Valid"
-    except Exception as e:
-        return False, f"Error: {str(e)}"
+def check_file(args):
+    wav_file, min_duration, min_rms = args
+    return wav_file, *is_valid_audio(wav_file, min_duration, min_rms)
 
-def move_valid_files(source_dir, dest_dir, min_duration=0.1, min_rms=0.01):
+def move_valid_files(source_dir, dest_dir, min_duration=0.1, min_rms=0.01, num_workers=1):
     """
     Move valid audio files from source directory to destination directory
     
@@ -47,44 +27,38 @@ def move_valid_files(source_dir, dest_dir, min_duration=0.1, min_rms=0.01):
         dest_dir (str): Directory to move valid files to
         min_duration (float): Minimum duration in seconds
         min_rms (float): Minimum RMS energy threshold
+        num_workers (int): Processes validating files, moves stay in this process
     """
     # Create destination directory if it doesn't exist
     os.makedirs(dest_dir, exist_ok=True)
     
-    # Get all wav files
-    wav_files = []
-    for root, dirs, files in os.walk(source_dir):
-        for file in files:
-            if file.endswith('.wav'):
-                wav_files.append(os.path.join(root, file))
+    # Get all wav / flac files
+    wav_files = audio_files(source_dir)
     
-    print(f"Found {len(wav_files)} WAV files")
+    print(f"Found {len(wav_files)} audio files")
     
     # Process each file
     valid_count = 0
     invalid_count = 0
     
-    for wav_file in tqdm(wav_files, desc="Processing files"):
-        is_valid, reason = is_valid_audio(wav_file, min_duration, min_rms)
-        
-        if is_valid:
-            # Move valid file to destination
-            filename = os.path.basename(wav_file)
-            dest_path = os.path.join(dest_dir, filename)
-            
-            # Handle duplicate filenames
-            if os.path.exists(dest_path):
-                base, ext = os.path.splitext(filename)
-                counter = 1
-                while os.path.exists(dest_path):
-                    dest_path = os.path.join(dest_dir, f"{base}_{counter}{ext}")
-                    counter += 1
-            
-            shutil.move(wav_file, dest_path)
-            valid_count += 1
-        else:
-            invalid_count += 1
-            print(f"\nInvalid file: {wav_file} - {reason}")
+    check_args = [(wav_file, min_duration, min_rms) for wav_file in wav_files]
+    pool = mp.Pool(num_workers) if num_workers > 1 else None
+    results = pool.imap(check_file, check_args, chunksize=16) if pool is not None else map(check_file, check_args)
+    
+    try:
+        for wav_file, is_valid, reason in tqdm(results, total=len(wav_files), desc="Processing files"):
+            if is_valid:
+                # Move valid file to destination (duplicate filenames get a suffix)
+                dest_path = unique_path(dest_dir, os.path.basename(wav_file))
+                materialize(wav_file, dest_path, 'move')
+                valid_count += 1
+            else:
+                invalid_count += 1
+                print(f"\nInvalid file: {wav_file} - {reason}")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
     
     print(f"\nProcessing complete:")
     print(f"Valid files moved: {valid_count}")
@@ -99,4 +73,4 @@ if __name__ == "__main__":
     min_duration = 0.1  # Minimum duration in seconds
     min_rms = 0.01     # Minimum RMS energy threshold
     
-    move_valid_files(source_dir, dest_dir, min_duration, min_rms) 
\ No newline at end of file
+    move_valid_files(source_dir, dest_dir, min_duration, min_rms, args.num_workers) 
\ No newline at end of file
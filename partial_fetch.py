@@ -0,0 +1,295 @@
+"""
+Partial (byte-range) ingestion of mp3 objects.
+
+PaSST only looks at the first few seconds of a clip, so instead of
+downloading whole objects we read the ID3 tag size and the first frame
+header, estimate how many bytes cover the wanted seconds from the bitrate
+(or the Xing/Info VBR header), fetch just that leading range, decode it in
+memory and hand the signal to the extractor. When the window decodes to
+fewer seconds than asked (and the object is longer) the whole object is
+fetched instead.
+
+    python3 partial_fetch.py --pkl_path=oneshots.pkl --weights='weights dir' --seconds=10
+
+Sources are S3 (``S3Range``, ranged GetObject through a shared client, or
+the FilesystemS3 stand-in) or any HTTP server that honours Range headers
+(``HTTPRange``).
+"""
+import io, os, pickle, struct, threading, time
+from collections import deque
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+import soundfile as sf
+import librosa
+import torch
+from tqdm import tqdm
+from s3_download import make_client, is_permanent
+
+# kbps, [version][layer] (version 1 = MPEG1, 2 = MPEG2/2.5; layer 1..3)
+BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+DEFAULT_KBPS = 320
+
+
+def id3_size(head):
+    """Bytes taken by a leading ID3v2 tag (0 when there is none)"""
+    if len(head) < 10 or head[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in head[6:10]:
+        # syncsafe integer: 7 bit 씩
+        size = (size << 7) | (byte & 0x7f)
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def frame_header(head, start):
+    """(offset, kbps, sample rate, samples per frame) of the first mpeg frame at or after start"""
+    for i in range(start, len(head) - 4):
+        if head[i] != 0xff or head[i+1] & 0xe0 != 0xe0:
+            continue
+        version_bits = (head[i+1] >> 3) & 3
+        layer_bits = (head[i+1] >> 1) & 3
+        bitrate_index = head[i+2] >> 4
+        sr_index = (head[i+2] >> 2) & 3
+        if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sr_index == 3:
+            continue
+        version = 1 if version_bits == 3 else 2
+        layer = 4 - layer_bits
+        sr = SAMPLE_RATES[version_bits][sr_index]
+        samples = 384 if layer == 1 else (1152 if layer == 2 or version == 1 else 576)
+        return i, BITRATES[(version, layer)][bitrate_index], sr, samples
+    return None
+
+
+def xing_kbps(head, offset, sr, samples):
+    """Average bitrate from a Xing/Info header in the first frame (None when absent)"""
+    for tag in (b'Xing', b'Info'):
+        pos = head.find(tag, offset, offset + 64)
+        if pos < 0 or pos + 16 > len(head):
+            continue
+        flags = struct.unpack('>I', head[pos+4:pos+8])[0]
+        if flags & 3 != 3:
+            return None
+        frames, nbytes = struct.unpack('>II', head[pos+8:pos+16])
+        if frames == 0:
+            return None
+        return nbytes * 8 / (frames * samples / sr) / 1000
+    return None
+
+
+def window_bytes(head, seconds, margin=1.3):
+    """
+    Leading bytes that hold ``seconds`` of audio, estimated from the head of
+    an mp3 (ID3 tag + first frame). None when the head is not enough to say
+    (e.g. the ID3 tag is longer than head).
+    """
+    start = id3_size(head)
+    if start >= len(head):
+        return None
+    frame = frame_header(head, start)
+    if frame is None:
+        return None
+    offset, kbps, sr, samples = frame
+    kbps = xing_kbps(head, offset, sr, samples) or kbps or DEFAULT_KBPS
+    return offset + int(kbps * 1000 / 8 * seconds * margin) + 4096
+
+
+class S3Range:
+    def __init__(self, bucket, client=None, workers=16):
+        self.bucket = bucket
+        self.client = client if client is not None else make_client(workers)
+
+    def read(self, key, start=0, end=None):
+        """bytes [start, end] of the object (all of it when end is None) and the object size"""
+        kwargs = {} if end is None else {'Range': f'bytes={start}-{end}'}
+        res = self.client.get_object(Bucket=self.bucket, Key=key, **kwargs)
+        data = res['Body'].read()
+        total = int(res['ContentRange'].split('/')[-1]) if 'ContentRange' in res else len(data)
+        return data, total
+
+
+class HTTPRange:
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def read(self, key, start=0, end=None):
+        headers = {} if end is None else {'Range': f'bytes={start}-{end}'}
+        with urlopen(Request(f'{self.base_url}/{key}', headers=headers), timeout=self.timeout) as res:
+            data = res.read()
+            content_range = res.headers.get('Content-Range')
+        # Range 를 무시하는 서버는 200 으로 전체를 보냄
+        total = int(content_range.split('/')[-1]) if content_range else len(data)
+        return data, total
+
+
+class PartialFetcher:
+    """
+    Fetch and decode the leading ``seconds`` of mp3 objects.
+
+    Stats (objects, bytes fetched, object bytes, full fallbacks) show how
+    much transfer the partial mode saved.
+    """
+
+    def __init__(self, source, probe_bytes=64 * 1024, margin=1.3, retries=3, backoff=0.5):
+        self.source = source
+        self.probe_bytes = probe_bytes
+        self.margin = margin
+        self.retries = retries
+        self.backoff = backoff
+        self.objects = 0
+        self.fetched = 0
+        self.total = 0
+        self.fallbacks = 0
+        self.lock = threading.Lock()
+
+    def read(self, key, start=0, end=None):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.source.read(key, start, end)
+            except Exception as e:
+                if is_permanent(e) or getattr(e, 'code', None) in (403, 404) or attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def fetch(self, key, seconds):
+        """(leading bytes covering ``seconds``, object size)"""
+        head, total = self.read(key, 0, self.probe_bytes - 1)
+        if len(head) >= total:
+            return head, total
+        n = window_bytes(head, seconds, self.margin)
+        if n is None:
+            # ID3 tag (앨범 아트 등) 가 probe 보다 크면 tag 크기만큼 다시 받음
+            tag = id3_size(head)
+            if tag >= len(head):
+                rest, _ = self.read(key, len(head), min(tag + self.probe_bytes, total) - 1)
+                head += rest
+                n = window_bytes(head, seconds, self.margin)
+        if n is None or n >= total:
+            data, total = self.read(key)
+            return data, total
+        if n > len(head):
+            rest, _ = self.read(key, len(head), n - 1)
+            head += rest
+        return head, total
+
+    def load(self, key, seconds, sr=32000):
+        """first ``seconds`` of the object decoded at ``sr`` (mono float32)"""
+        data, total = self.fetch(key, seconds)
+        try:
+            y, native_sr = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+            fallback = len(data) < total and y.shape[0] < seconds * native_sr
+        except Exception:
+            # 잘린 range 가 decode 되지 않으면 전체로 다시 시도
+            if len(data) >= total:
+                raise
+            fallback = True
+        if fallback:
+            # bitrate 추정이 틀려 window 가 짧으면 전체를 받음
+            data, total = self.read(key)
+            y, native_sr = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+        with self.lock:
+            self.objects += 1
+            self.fetched += len(data)
+            self.total += total
+            self.fallbacks += fallback
+        y = y.mean(axis=1)[:int(seconds * native_sr)]
+        if native_sr != sr:
+            y = librosa.resample(y, orig_sr=native_sr, target_sr=sr)
+        return y
+
+    def iter_windows(self, keys, seconds, sr=32000, workers=16):
+        """
+        (key, signal or None) in key order, fetched by a thread pool.
+
+        At most 2 x workers windows are in flight or waiting to be consumed,
+        so a slow consumer (the model) holds the fetches back instead of
+        decoded windows piling up in memory.
+        """
+        def work(key):
+            try:
+                return key, self.load(key, seconds, sr)
+            except Exception:
+                return key, None
+        pending = deque()
+        with ThreadPoolExecutor(workers) as executor:
+            for key in keys:
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(work, key))
+            while pending:
+                yield pending.popleft().result()
+
+    def stats(self):
+        return {'objects': self.objects, 'fetched_bytes': self.fetched, 'object_bytes': self.total,
+                'saved': 1 - self.fetched / self.total if self.total else 0.0, 'fallbacks': self.fallbacks}
+
+
+def embed_objects(embed_clips, fetcher, keys, seconds=10, batch_size=16, workers=16):
+    """
+    PaSST embeddings of the first ``seconds`` of every object.
+
+    ``embed_clips`` is NNDB.embed_clips (list of 32kHz clips -> embeddings);
+    windows are batched ``batch_size`` at a time as they arrive.
+
+    Returns:
+        embeddings (list), keys (list) of the objects that decoded
+    """
+    embeddings, result_keys, batch, batch_keys = [], [], [], []
+    for key, y in tqdm(fetcher.iter_windows(keys, seconds, 32000, workers), total=len(keys)):
+        if y is None or len(y) == 0:
+            continue
+        batch.append(y)
+        batch_keys.append(key)
+        if len(batch) == batch_size:
+            embeddings += embed_clips([torch.from_numpy(c) for c in batch])
+            result_keys += batch_keys
+            batch, batch_keys = [], []
+    if batch:
+        embeddings += embed_clips([torch.from_numpy(c) for c in batch])
+        result_keys += batch_keys
+    return embeddings, result_keys
+
+
+def get_args():
+    parser = ArgumentParser()
+    parser.add_argument('--pkl_path', type=str, help='oneshot list (dicts with uuid), as for down_oneshot.py')
+    parser.add_argument('--weights', type=str, help='NNDB weights dir to write index.bin to')
+    parser.add_argument('--seconds', type=float, default=10, help='leading seconds to fetch (NNDB max_seconds)')
+    parser.add_argument('--bucket', type=str, default='soundary')
+    parser.add_argument('--url', type=str, default=None, help='fetch from this range-capable http server instead of S3')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--batch_size', type=int, default=16)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    from hear21passt.base import get_basic_model
+    from vector.loader import passt_embed
+    from vector.index_file import write_index
+    args = get_args()
+    with open(args.pkl_path, 'rb') as f:
+        oneshots = pickle.load(f)
+    keys = [f"sample-audio/{sample['uuid']}.mp3" for sample in oneshots]
+    source = HTTPRange(args.url) if args.url else S3Range(args.bucket, workers=args.workers)
+    fetcher = PartialFetcher(source)
+
+    device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+    model = get_basic_model(mode='embed_only').eval().to(device)
+    embeddings, result_keys = embed_objects(lambda clips: passt_embed(model, clips, device), fetcher, keys,
+                                            args.seconds, args.batch_size, args.workers)
+    os.makedirs(args.weights, exist_ok=True)
+    # index 의 path 는 나중에 받을 wav 이름과 같은 stem (uuid) 을 씀
+    paths = [f"{os.path.splitext(os.path.basename(key))[0]}.wav" for key in result_keys]
+    write_index(f'{args.weights}/index.bin', torch.stack(embeddings), paths)
+    print(fetcher.stats())
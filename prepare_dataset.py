@@ -1,7 +1,8 @@
 from glob import glob
 from argparse import ArgumentParser
-import os, pickle, json, boto3
+import os, pickle, json
 from tqdm import tqdm
+from s3_download import Downloader
 
 
 def get_args():
@@ -9,6 +10,7 @@ def get_args():
     args.add_argument('--wav_dir', type=str, help='Directory to save wav files')
     args.add_argument('--json_dir', type=str, help='Directory to save json files')
     args.add_argument('--mapping_dir',type=str)
+    args.add_argument('--workers', type=int, default=32, help='concurrent downloads')
     args = args.parse_args()
     return args
 
@@ -22,17 +24,17 @@ def process_json(json_path):
         return_list.append((idx,path))
     return return_list
 
-def download_mp3(mapping_file, wav_dir):
-    global bucket_name
+def download_mp3(mapping_file, wav_dir, downloader):
     with open(mapping_file,'rb') as f:
         mapping_list = pickle.load(f)
     segment_name = mapping_file.split('/')[-1].split('.')[0]
-    s3 = boto3.client('s3')
-    for idx, path in tqdm(mapping_list, desc='downloading wav files'):
+    jobs = []
+    for idx, path in mapping_list:
         name = path.split('/')[-1].split('.')[0]
         key = f'sample-audio/{name}.mp3'
         output_path = os.path.join(wav_dir, f"{segment_name}__{idx}.mp3")
-        s3.download_file(bucket_name, key, output_path)
+        jobs.append((key, output_path))
+    return downloader.download(jobs, desc=segment_name)
 
 
 if __name__ == '__main__':
@@ -49,6 +51,8 @@ if __name__ == '__main__':
     #     with open(f'{args.mapping_dir}/{name}.pkl','wb') as f:
     #         pickle.dump(mapping_list,f)
 
+    # 같은 key 가 여러 segment 에 나올 수 있으므로 manifest 대신 output 파일 존재로 resume
+    downloader = Downloader(bucket_name, workers=args.workers)
     mappings = glob(f'{args.mapping_dir}/*.pkl')
     for mapping in tqdm(mappings, desc='downloading wav files'):
-        download_mp3(mapping, args.wav_dir)
+        download_mp3(mapping, args.wav_dir, downloader)
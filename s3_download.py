@@ -0,0 +1,162 @@
+"""
+Common S3 download engine.
+
+Objects are fetched by a thread pool that shares one boto3 client (boto3
+clients are thread safe, the connection pool is sized to the thread
+count). Large objects go through TransferConfig multipart downloads,
+transient errors are retried with exponential backoff, and every finished
+key is appended to a manifest file so an interrupted run resumes where it
+stopped.
+
+    downloader = Downloader('soundary', workers=32, manifest='wavs/.downloaded')
+    stats = downloader.download([(key, local_path), ...])
+"""
+import io, os, random, shutil, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+MB = 1024 * 1024
+
+
+def make_client(workers=16, max_concurrency=4):
+    import boto3
+    from botocore.config import Config
+    # retry 는 Downloader 에서 하므로 botocore 자체 retry 는 줄임
+    config = Config(max_pool_connections=workers * max_concurrency, retries={'max_attempts': 2, 'mode': 'standard'})
+    return boto3.session.Session().client('s3', config=config)
+
+
+def transfer_config(multipart_threshold=8 * MB, chunksize=8 * MB, max_concurrency=4):
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=multipart_threshold, multipart_chunksize=chunksize,
+                          max_concurrency=max_concurrency, use_threads=max_concurrency > 1)
+
+
+def is_permanent(error):
+    """404 / 403 and friends are not worth retrying"""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        code = str(response.get('Error', {}).get('Code', ''))
+        return code in ('404', '403', 'NoSuchKey', 'NoSuchBucket', 'AccessDenied')
+    return isinstance(error, (FileNotFoundError, PermissionError))
+
+
+class FilesystemS3:
+    """Stand-in client serving ``{root}/{bucket}/{key}``, for local runs and tests"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_object(self, Bucket, Key, Range=None):
+        path = os.path.join(self.root, Bucket, Key)
+        total = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if Range is None:
+                return {'Body': io.BytesIO(f.read()), 'ContentLength': total}
+            start, end = (int(v) for v in Range[len('bytes='):].split('-'))
+            end = min(end, total - 1)
+            f.seek(start)
+            data = f.read(end - start + 1)
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data), 'ContentRange': f'bytes {start}-{end}/{total}'}
+
+    def download_file(self, Bucket, Key, Filename, Config=None):
+        tmp = f'{Filename}.part'
+        shutil.copyfile(os.path.join(self.root, Bucket, Key), tmp)
+        os.replace(tmp, Filename)
+
+
+class Downloader:
+    def __init__(self, bucket, client=None, workers=16, retries=5, backoff=0.5, manifest=None,
+                 skip_existing=True, config=None):
+        """
+        Args:
+            bucket (str): S3 bucket
+            client: boto3 s3 client (or a stand-in such as FilesystemS3), shared by all threads
+            workers (int): concurrent downloads
+            retries (int): attempts per object after the first one
+            backoff (float): first retry delay in seconds, doubled every attempt
+            manifest (str): file of finished keys, read on start and appended to
+            skip_existing (bool): treat an existing local file as finished
+            config: boto3 TransferConfig (multipart settings)
+        """
+        self.bucket = bucket
+        self.workers = workers
+        self.client = client if client is not None else make_client(workers)
+        self.config = config if config is not None or client is not None else transfer_config()
+        self.retries = retries
+        self.backoff = backoff
+        self.manifest = manifest
+        self.skip_existing = skip_existing
+        self.lock = threading.Lock()
+        self.finished = set()
+        if manifest is not None and os.path.exists(manifest):
+            with open(manifest, 'r', encoding='utf-8') as f:
+                self.finished = {line.rstrip('\n') for line in f if line.strip()}
+
+    def fetch(self, key, path):
+        """Download one object with retries, returns its size in bytes"""
+        for attempt in range(self.retries + 1):
+            try:
+                if self.config is not None:
+                    self.client.download_file(Bucket=self.bucket, Key=key, Filename=path, Config=self.config)
+                else:
+                    self.client.download_file(Bucket=self.bucket, Key=key, Filename=path)
+                return os.path.getsize(path)
+            except Exception as e:
+                if is_permanent(e) or attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    def mark(self, key, log):
+        with self.lock:
+            self.finished.add(key)
+            if log is not None:
+                log.write(key + '\n')
+                log.flush()
+
+    def download(self, jobs, desc='downloading'):
+        """
+        Download (key, local path) pairs.
+
+        Returns:
+            dict: done / skipped counts, failed (key -> error), bytes, seconds, MB/s
+        """
+        pending = []
+        skipped = 0
+        for key, path in jobs:
+            if key in self.finished or (self.skip_existing and os.path.exists(path)):
+                skipped += 1
+            else:
+                pending.append((key, path))
+        for path in {os.path.dirname(path) for _, path in pending}:
+            if path:
+                os.makedirs(path, exist_ok=True)
+
+        log = open(self.manifest, 'a', encoding='utf-8') if self.manifest is not None else None
+        failed, nbytes, done = {}, 0, 0
+        start = time.time()
+        try:
+            with ThreadPoolExecutor(self.workers) as executor, tqdm(total=len(pending), desc=desc) as pbar:
+                futures = {executor.submit(self.fetch, key, path): key for key, path in pending}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        nbytes += future.result()
+                        done += 1
+                        self.mark(key, log)
+                    except Exception as e:
+                        failed[key] = f'{type(e).__name__}: {e}'
+                    pbar.update(1)
+                    pbar.set_postfix(MBps=f'{nbytes / MB / max(time.time() - start, 1e-6):.1f}', fail=len(failed))
+        finally:
+            if log is not None:
+                log.close()
+
+        seconds = time.time() - start
+        stats = {'done': done, 'skipped': skipped, 'failed': failed, 'bytes': nbytes,
+                 'seconds': seconds, 'MBps': nbytes / MB / max(seconds, 1e-6)}
+        print(f"total : {len(jobs)}, done : {done}, skipped : {skipped}, fail : {len(failed)}, "
+              f"{stats['MBps']:.1f} MB/s, {done / max(seconds, 1e-6):.1f} files/s")
+        for key, error in list(failed.items())[:5]:
+            print(f'  {key} : {error}')
+        return stats
@@ -0,0 +1,117 @@
+"""
+Minimal client for server.py, and a local smoke check.
+
+    python3 search_client.py --url=http://127.0.0.1:10012 --path='lp/ts.wav' --method=fft --k=10
+    python3 search_client.py --url=http://127.0.0.1:10012 --path='query.wav' --upload --where='{"bpm": [120, 130]}'
+
+--smoke loads the indexes like server.py, serves them on an ephemeral
+port in this process and checks /health, a json /search and an upload
+/search (which must agree, ``where`` included):
+
+    python3 search_client.py --smoke --db_dir='wav dir' --fft='weights dir' --method=fft
+"""
+import asyncio, json, os, threading
+from argparse import ArgumentParser
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+
+def get_args():
+    parser = ArgumentParser()
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:10012')
+    parser.add_argument('--path', type=str, default=None, help='query file (default with --smoke: the first indexed file)')
+    parser.add_argument('--method', type=str, default='passot')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--where', type=str, default=None, help='json filters, e.g. {"bpm": [120, 130]}')
+    parser.add_argument('--upload', action='store_true', help='send the file bytes instead of its path')
+    parser.add_argument('--smoke', action='store_true', help='start a server on an ephemeral port and check it')
+    parser.add_argument('--db_dir', type=str, default=None)
+    parser.add_argument('--passot', type=str, default=None)
+    parser.add_argument('--fft', type=str, default=None)
+    parser.add_argument('--mfcc', type=str, default=None)
+    args = parser.parse_args()
+    return args
+
+
+def call(url, data=None, headers=None, timeout=60):
+    """(status, json payload) of a request, error statuses included"""
+    try:
+        with urlopen(Request(url, data=data, headers=headers or {}), timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def health(url):
+    return call(f'{url}/health')
+
+
+def search(url, path, method='passot', k=10, where=None):
+    """search by a path the server can read (under its --roots)"""
+    body = json.dumps({'path': path, 'method': method, 'k': k, 'where': where}).encode('utf-8')
+    return call(f'{url}/search', body, {'Content-Type': 'application/json'})
+
+
+def search_upload(url, path, method='passot', k=10, where=None):
+    """search by the bytes of a local file"""
+    query = {'method': method, 'k': k, 'suffix': os.path.splitext(path)[1] or '.wav'}
+    if where is not None:
+        query['where'] = json.dumps(where)
+    with open(path, 'rb') as f:
+        body = f.read()
+    return call(f'{url}/search?{urlencode(query)}', body, {'Content-Type': 'application/octet-stream'})
+
+
+def serve_in_background(service):
+    """run service on 127.0.0.1 with an ephemeral port, returns (url, stop)"""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(service.handle, '127.0.0.1', 0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+        service.executor.shutdown()
+    return f'http://127.0.0.1:{port}', stop
+
+
+def smoke(args, where=None):
+    from server import SearchService, load_dbs
+    dbs = load_dbs(args)
+    if not dbs:
+        raise SystemExit('--smoke needs at least one of --passot / --fft / --mfcc')
+    path = args.path or next(iter(dbs.values())).paths[0]
+    service = SearchService(dbs, [args.db_dir, os.path.dirname(os.path.abspath(path))])
+    url, stop = serve_in_background(service)
+    try:
+        status, payload = health(url)
+        assert status == 200 and args.method in payload['methods'], (status, payload)
+        print(f'/health : {payload}')
+        status, by_path = search(url, path, args.method, args.k, where)
+        assert status == 200, (status, by_path)
+        print(f"/search (json)   : {by_path['names'][:5]} ...")
+        status, by_upload = search_upload(url, path, args.method, args.k, where)
+        assert status == 200, (status, by_upload)
+        print(f"/search (upload) : {by_upload['names'][:5]} ...")
+        # upload 는 임시 파일이라 path 만 다르고 결과는 같아야 함
+        assert by_path['paths'] == by_upload['paths'], 'json and upload searches disagree'
+        print('smoke ok')
+    finally:
+        stop()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    where = json.loads(args.where) if args.where else None
+    if args.smoke:
+        smoke(args, where)
+    elif args.upload:
+        print(search_upload(args.url, args.path, args.method, args.k, where))
+    else:
+        print(search(args.url, args.path, args.method, args.k, where))
@@ -0,0 +1,267 @@
+"""
+Resident search server.
+
+The indexes (and the PaSST model) are loaded once at start-up and every
+request is answered from memory. Searches run in a thread pool so that a
+slow query does not block the event loop or the other requests.
+
+    python3 server.py --db_dir='wav dir' --passot='weights dir' --fft='weights dir'
+
+    GET  /health
+    GET  /stats
+    POST /search   {"path": "lp/ts.wav", "method": "passot", "k": 10,
+                    "where": {"bpm": [120, 130], "key": "A minor"}}
+    POST /search?method=passot&k=10   (raw audio bytes as the body)
+    POST /search?method=fft&where={"bpm":[120,130]}   (filters of an upload, or an X-Where header)
+
+passot queries are decoded in the thread pool and their PaSST forward
+passes are coalesced by a MicroBatcher (``--max_batch``, ``--max_wait_ms``).
+
+Query paths must live under one of the ``--roots`` directories. The server
+binds to 127.0.0.1 by default and is meant for local clients only.
+"""
+import asyncio, json, os, tempfile
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from urllib.parse import urlsplit, parse_qsl
+from vector import VanlillaDB, NNDB, QueryCache, MicroBatcher, hierarchical_search
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def get_args():
+    parser = ArgumentParser()
+    parser.add_argument('--db_dir', type=str, help='wav dir the indexes were built from')
+    parser.add_argument('--passot', type=str, default=None, help='NNDB weights dir')
+    parser.add_argument('--fft', type=str, default=None, help='VanlillaDB (fft) weights dir')
+    parser.add_argument('--mfcc', type=str, default=None, help='VanlillaDB (mfcc) weights dir')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=10012)
+    parser.add_argument('--workers', type=int, default=4, help='threads running the searches')
+    parser.add_argument('--roots', type=str, nargs='*', default=None, help='dirs query paths may come from (default: db_dir and lp)')
+    parser.add_argument('--cache_mb', type=int, default=256, help='query cache size, 0 disables it')
+    parser.add_argument('--max_upload_mb', type=int, default=64)
+    parser.add_argument('--max_batch', type=int, default=16, help='passot queries embedded per forward pass')
+    parser.add_argument('--max_wait_ms', type=float, default=5, help='how long a query waits for others to join its batch')
+    args = parser.parse_args()
+    return args
+
+
+class SearchService:
+    """Loaded indexes plus the executor the searches run in"""
+
+    def __init__(self, dbs, roots, workers=4, cache=None, max_upload=64 << 20, max_batch=16, max_wait=0.005):
+        self.dbs = dbs
+        self.roots = [os.path.realpath(root) for root in roots]
+        self.executor = ThreadPoolExecutor(workers)
+        self.cache = cache
+        self.max_upload = max_upload
+        self.requests = 0
+        self.errors = 0
+        self.search_seconds = 0.0
+        self.started = time()
+        self.batcher = None
+        if 'passot' in dbs:
+            self.batcher = MicroBatcher(dbs['passot'].embed_clips, max_batch, max_wait, self.executor,
+                                        dbs['passot'].forward_counts)
+
+    def methods(self):
+        methods = list(self.dbs)
+        if 'passot' in self.dbs and 'fft' in self.dbs:
+            methods.append('hierarchical')
+        return methods
+
+    def check_path(self, path):
+        real = os.path.realpath(path)
+        if not any(os.path.commonpath([real, root]) == root for root in self.roots):
+            raise HTTPError(403, f'{path} is outside the library roots')
+        if not os.path.isfile(real):
+            raise HTTPError(404, f'{path} not found')
+        return real
+
+    def run(self, path, method, k, where=None):
+        if method == 'hierarchical':
+            if where:
+                raise HTTPError(400, 'hierarchical search does not take filters')
+            return hierarchical_search(self.dbs['passot'], self.dbs['fft'], path, k), None
+        paths, values = self.dbs[method].get_k_sims(path, k, where=where)
+        return list(paths), [float(v) for v in values]
+
+    def prepare_passot(self, path):
+        """cached embedding of path, or its decoded clip for the batcher"""
+        nndb = self.dbs['passot']
+        key = nndb.embedding_key(path) if nndb.cache is not None else None
+        embedding = nndb.cache.get(key) if key is not None else None
+        if embedding is not None:
+            return key, embedding, None
+        return key, None, nndb.load_query(path)
+
+    def finish_passot(self, embedding, k, where=None):
+        nndb = self.dbs['passot']
+        value, idxs = nndb.search(embedding.to(nndb.device), k, where=where)
+        n = min(k, len(idxs))
+        return [nndb.paths[idxs[i]] for i in range(n)], [float(value[i]) for i in range(n)]
+
+    async def run_passot(self, path, k, where=None):
+        loop = asyncio.get_running_loop()
+        key, embedding, clip = await loop.run_in_executor(self.executor, self.prepare_passot, path)
+        if embedding is None:
+            embedding = await self.batcher.submit(clip)
+            if key is not None:
+                self.dbs['passot'].cache.put(key, embedding.cpu())
+        return await loop.run_in_executor(self.executor, self.finish_passot, embedding, k, where)
+
+    async def search(self, path, method, k, where=None):
+        if method not in self.methods():
+            raise HTTPError(400, f'unknown method {method}, loaded: {self.methods()}')
+        if k < 1:
+            raise HTTPError(400, 'k must be positive')
+        start = time()
+        loop = asyncio.get_running_loop()
+        if method == 'passot':
+            paths, values = await self.run_passot(path, k, where)
+        else:
+            paths, values = await loop.run_in_executor(self.executor, self.run, path, method, k, where)
+        elapsed = time() - start
+        self.search_seconds += elapsed
+        result = {'method': method, 'k': k, 'paths': paths,
+                  'names': [os.path.splitext(os.path.basename(p))[0] for p in paths],
+                  'seconds': round(elapsed, 4)}
+        if values is not None:
+            result['distances'] = values
+        return result
+
+    async def search_upload(self, body, method, k, suffix='.wav', where=None):
+        # librosa 는 path 를 받으므로 upload 를 임시 파일로 저장
+        fd, tmp = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            return await self.search(tmp, method, k, where)
+        finally:
+            os.remove(tmp)
+
+    def stats(self):
+        stats = {'requests': self.requests, 'errors': self.errors,
+                 'search_seconds': round(self.search_seconds, 3),
+                 'uptime': round(time() - self.started, 1),
+                 'rows': {name: len(db.paths) for name, db in self.dbs.items()}}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        if self.batcher is not None:
+            stats['batcher'] = self.batcher.stats()
+        return stats
+
+    async def route(self, method, target, headers, body):
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        if url.path == '/health':
+            return {'status': 'ok', 'methods': self.methods()}
+        if url.path == '/stats':
+            return self.stats()
+        if url.path != '/search':
+            raise HTTPError(404, f'no route {url.path}')
+        if method != 'POST':
+            raise HTTPError(405, '/search expects POST')
+
+        if headers.get('content-type', '').startswith('application/json'):
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError:
+                raise HTTPError(400, 'invalid json body')
+            if 'path' not in request:
+                raise HTTPError(400, 'json body needs a path')
+            return await self.search(self.check_path(request['path']), request.get('method', 'passot'),
+                                     int(request.get('k', 10)), request.get('where'))
+        if not body:
+            raise HTTPError(400, 'empty upload')
+        # body 가 audio 이므로 filter 는 query 의 where 나 X-Where header 에 json 으로
+        where = query.get('where', headers.get('x-where'))
+        if where is not None:
+            try:
+                where = json.loads(where)
+            except ValueError:
+                raise HTTPError(400, 'where must be json')
+        return await self.search_upload(body, query.get('method', 'passot'), int(query.get('k', 10)),
+                                        suffix=query.get('suffix', '.wav'), where=where)
+
+    async def handle(self, reader, writer):
+        status, payload = 200, None
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            if length > self.max_upload:
+                raise HTTPError(413, f'body larger than {self.max_upload} bytes')
+            body = await reader.readexactly(length) if length else b''
+            self.requests += 1
+            payload = await self.route(method, target, headers, body)
+        except HTTPError as e:
+            status, payload = e.status, {'error': str(e)}
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, payload = 400, {'error': f'bad request: {e}'}
+        except Exception as e:
+            status, payload = 500, {'error': f'{type(e).__name__}: {e}'}
+        if status != 200:
+            self.errors += 1
+        data = json.dumps(payload).encode('utf-8')
+        writer.write(f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                     f'Content-Type: application/json\r\nContent-Length: {len(data)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1') + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=10012):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f'serving {self.methods()} on http://{host}:{port}')
+        async with server:
+            await server.serve_forever()
+
+
+def check_weights(method, weights):
+    # weights 가 없으면 NNDB / VanlillaDB 가 server 안에서 전체 index 를 만들기 시작함
+    if not any(os.path.exists(f'{weights}/{name}') for name in ('index.bin', 'weight.pt', 'tensor.pt')):
+        raise SystemExit(f'--{method}={weights} holds no index, build it first with initialize.py')
+
+
+def load_dbs(args, cache=None):
+    dbs = {}
+    for method in ['passot', 'fft', 'mfcc']:
+        if getattr(args, method):
+            check_weights(method, getattr(args, method))
+    if args.passot:
+        dbs['passot'] = NNDB(args.db_dir, weights=args.passot, cache=cache)
+    for method in ['fft', 'mfcc']:
+        weights = getattr(args, method)
+        if weights:
+            dbs[method] = VanlillaDB(args.db_dir, weights=weights, method=method, cache=cache)
+    return dbs
+
+
+if __name__ == '__main__':
+    args = get_args()
+    cache = QueryCache(max_bytes=args.cache_mb << 20) if args.cache_mb > 0 else None
+    dbs = load_dbs(args, cache)
+    roots = args.roots if args.roots is not None else [args.db_dir, 'lp']
+    service = SearchService(dbs, roots, workers=args.workers, cache=cache, max_upload=args.max_upload_mb << 20,
+                            max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+    asyncio.run(service.serve(args.host, args.port))
@@ -0,0 +1,121 @@
+"""
+Fast sample validation shared by filter_samples.py and move_valid_files.py.
+
+Instead of decoding and resampling the whole file with librosa.load, the
+duration comes from the header (soundfile.info) and the RMS check reads
+the file in blocks at its native rate, stopping at the first frame loud
+enough. Valid files are materialised with a hardlink / reflink /
+os.replace instead of a ``cp`` subprocess.
+"""
+import fcntl, os, shutil
+import numpy as np
+import soundfile as sf
+
+FICLONE = 0x40049409
+# cvtmp3.EXTENSIONS 중 soundfile 로 읽히는 형식 (npy 는 제외)
+AUDIO_EXTENSIONS = ('.wav', '.flac')
+
+
+def audio_files(root_dir):
+    """wav / flac files under root_dir (recursive)"""
+    paths = []
+    for root, dirs, files in os.walk(root_dir):
+        for file in files:
+            if file.lower().endswith(AUDIO_EXTENSIONS):
+                paths.append(os.path.join(root, file))
+    return paths
+
+
+def max_rms(path, min_rms=None, frame_length=2048, hop_length=512, block=1 << 16):
+    """
+    Largest frame RMS of the file with librosa.feature.rms framing (centered,
+    zero padded), read ``block`` frames at a time. Returns as soon as a frame
+    reaches ``min_rms``, so a loud file costs one block.
+    """
+    pad = np.zeros(frame_length // 2, dtype=np.float32)
+    peak = 0.0
+    with sf.SoundFile(path) as f:
+        carry = pad
+        while True:
+            data = f.read(block, dtype='float32', always_2d=True)
+            last = len(data) < block
+            y = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+            buf = np.concatenate([carry, y, pad] if last else [carry, y])
+            if len(buf) >= frame_length:
+                count = (len(buf) - frame_length) // hop_length + 1
+                power = np.concatenate([[0.0], np.cumsum(buf.astype(np.float64) ** 2)])
+                starts = np.arange(count) * hop_length
+                peak = max(peak, float(np.sqrt((power[starts + frame_length] - power[starts]).max() / frame_length)))
+                if min_rms is not None and peak >= min_rms:
+                    return peak
+                carry = buf[count * hop_length:]
+            else:
+                carry = buf
+            if last:
+                return peak
+
+
+def is_valid_audio(file_path, min_duration=0.1, min_rms=0.01):
+    """
+    Check if an audio file is valid:
+    - Not too short (default: > 0.1 seconds), from the header
+    - Has actual sound (default: a frame with RMS > 0.01), streamed
+    """
+    try:
+        info = sf.info(file_path)
+        if info.frames < min_duration * info.samplerate:
+            return False, "Too short"
+        if max_rms(file_path, min_rms) < min_rms:
+            return False, "No sound"
+        return True, "Valid"
+    except Exception as e:
+        return False, f"Error: {str(e)}"
+
+
+def clone(src, dst):
+    """copy src to dst, as a reflink (shared extents) when the filesystem supports it"""
+    tmp = f'{dst}.part'
+    try:
+        with open(src, 'rb') as s, open(tmp, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        # reflink 이 안 되는 fs 는 copy_file_range / sendfile 을 쓰는 copyfile 로
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def materialize(src, dst, mode='link'):
+    """
+    Put src at dst without a subprocess.
+
+    mode 'link' hardlinks (a reflink / copy across filesystems), 'copy'
+    reflinks or copies, 'move' renames (copy + delete across filesystems).
+    An existing dst is replaced.
+    """
+    if mode == 'move':
+        try:
+            os.replace(src, dst)
+        except OSError:
+            shutil.move(src, dst)
+        return dst
+    if mode == 'link':
+        try:
+            if os.path.lexists(dst):
+                os.remove(dst)
+            os.link(src, dst)
+            return dst
+        except OSError:
+            pass
+    clone(src, dst)
+    return dst
+
+
+def unique_path(dest_dir, filename):
+    """dest_dir/filename, with _1, _2 ... appended while that name is taken"""
+    dest_path = os.path.join(dest_dir, filename)
+    base, ext = os.path.splitext(filename)
+    counter = 1
+    while os.path.exists(dest_path):
+        dest_path = os.path.join(dest_dir, f"{base}_{counter}{ext}")
+        counter += 1
+    return dest_path
@@ -1,13 +1,17 @@
 import numpy as np
 import librosa
 import scipy.signal
+import torch
 import os
 
 
 def extract_attack_features(wav_path, sr=22050):
     # Load audio
     y, sr = librosa.load(wav_path, sr=sr)
+    return attack_features_from_signal(y, sr)
 
+
+def attack_features_from_signal(y, sr):
     # Step 1: Full-wave rectification (절댓값)
     y_rectified = np.abs(y)
 
@@ -33,4 +37,21 @@ def extract_attack_features(wav_path, sr=22050):
     return {
         "attack_time": attack_time,
         "attack_slope": attack_slope
-    }
\ No newline at end of file
+    }
+
+
+def compute_attack_descriptors(path, sr=22050):
+    """attack_time, attack_slope as a vector (False on failure), for VanlillaDB / FeatureStore"""
+    try:
+        features = extract_attack_features(path, sr=sr)
+    except Exception:
+        return False
+    return torch.tensor([features['attack_time'], features['attack_slope']], dtype=torch.float64)
+
+
+def compute_attack_from_signal(y, sr, target_sr=22050):
+    """compute_attack_descriptors of an already decoded signal, resampled to target_sr first"""
+    if sr != target_sr:
+        y = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
+    features = attack_features_from_signal(y, target_sr)
+    return torch.tensor([features['attack_time'], features['attack_slope']], dtype=torch.float64)
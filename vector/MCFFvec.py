@@ -46,69 +46,77 @@ def compute_fft_descriptors_internal(y, sr):
 
     return features
 
+def compute_enhanced_from_signal(y, sr):
+    """
+    47차원 향상된 특성 (이미 decode 된 signal 용).
+
+    STFT 는 한 번만 계산하고 (librosa 기본값 n_fft=2048, hop=512) 모든
+    spectral 특성을 그 magnitude / mel projection 에서 얻는다. 각 librosa
+    함수가 y 로부터 따로 STFT 를 계산하던 것과 같은 값이다.
+    """
+    # 기존 FFT 특성
+    fft_features = compute_fft_descriptors_internal(y, sr)
+
+    # 공통 STFT 와 mel projection
+    stft = librosa.stft(y)
+    spec = np.abs(stft)
+    log_mel = librosa.power_to_db(librosa.feature.melspectrogram(S=spec ** 2, sr=sr))
+
+    # 1. MFCC (Mel-Frequency Cepstral Coefficients) - 음색 표현에 효과적
+    mfcc = librosa.feature.mfcc(S=log_mel, n_mfcc=13)
+    mfcc_mean = np.mean(mfcc, axis=1)
+    mfcc_var = np.var(mfcc, axis=1)
+
+    # 2. 스펙트럼 대비(Spectral Contrast) - 음색의 피크와 밸리 관계 포착
+    contrast = librosa.feature.spectral_contrast(S=spec, sr=sr)
+    contrast_mean = np.mean(contrast, axis=1)
+
+    # 3. 스펙트럼 중심(Spectral Centroid) - 스펙트럼의 "무게 중심"
+    centroid = librosa.feature.spectral_centroid(S=spec, sr=sr)[0]
+    centroid_mean = np.mean(centroid)
+
+    # 4. 스펙트럼 대역폭(Spectral Bandwidth) - 주파수 분포 폭
+    bandwidth = librosa.feature.spectral_bandwidth(S=spec, sr=sr)[0]
+    bandwidth_mean = np.mean(bandwidth)
+
+    # 5. 퍼커시브 특성(Percussive Features) - 드럼 FX에 특화
+    # librosa.effects.hpss 와 동일하게 분리 후 istft 로 복원
+    stft_harmonic, stft_percussive = librosa.decompose.hpss(stft)
+    y_harmonic = librosa.istft(stft_harmonic, dtype=y.dtype, length=len(y))
+    y_percussive = librosa.istft(stft_percussive, dtype=y.dtype, length=len(y))
+    # 타악기 성분의 에너지
+    percussive_energy = np.sum(y_percussive ** 2)
+    # 타악기/하모닉 비율
+    harmonic_energy = np.sum(y_harmonic ** 2)
+    perc_harm_ratio = percussive_energy / harmonic_energy if harmonic_energy > 0 else 1.0
+
+    # 6. 시간적 특성(Temporal Features)
+    # 소리의 어택(Attack) 특성
+    onset_env = librosa.onset.onset_strength(S=log_mel, sr=sr)
+    onset_mean = np.mean(onset_env)
+    onset_max = np.max(onset_env)
+
+    # 7. 변화율(Flux) - 인접 프레임간 스펙트럼 변화
+    flux = np.sum(np.diff(spec, axis=1) ** 2, axis=0)
+    flux_mean = np.mean(flux)
+
+    # 모든 특성 결합 및 정규화
+    features = np.concatenate([
+        fft_features,  # 기존 7개 특성
+        mfcc_mean, mfcc_var,  # MFCC 평균 및 분산 (26개)
+        contrast_mean,  # 스펙트럼 대비 (7개)
+        [centroid_mean, bandwidth_mean],  # 중심 및 대역폭 (2개)
+        [percussive_energy, perc_harm_ratio],  # 퍼커시브 특성 (2개)
+        [onset_mean, onset_max, flux_mean]  # 시간적 특성 (3개)
+    ])
+
+    return torch.tensor(features)
+
 def compute_enhanced_descriptors(path):
     """향상된 오디오 특성 추출 함수"""
-    is_mp3 = path.lower().endswith('.mp3')
-    temp_wav_path = None
-
     try:
-        audio_path = path
         # 오디오 로드
-        y, sr = librosa.load(audio_path, sr=None)
-
-        # 임시 파일 정리
-        if temp_wav_path and os.path.exists(temp_wav_path):
-            os.unlink(temp_wav_path)
-
-        # 기존 FFT 특성
-        fft_features = compute_fft_descriptors_internal(y, sr)
-
-        # 1. MFCC (Mel-Frequency Cepstral Coefficients) - 음색 표현에 효과적
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        mfcc_mean = np.mean(mfcc, axis=1)
-        mfcc_var = np.var(mfcc, axis=1)
-
-        # 2. 스펙트럼 대비(Spectral Contrast) - 음색의 피크와 밸리 관계 포착
-        contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-        contrast_mean = np.mean(contrast, axis=1)
-
-        # 3. 스펙트럼 중심(Spectral Centroid) - 스펙트럼의 "무게 중심"
-        centroid = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        centroid_mean = np.mean(centroid)
-
-        # 4. 스펙트럼 대역폭(Spectral Bandwidth) - 주파수 분포 폭
-        bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
-        bandwidth_mean = np.mean(bandwidth)
-
-        # 5. 퍼커시브 특성(Percussive Features) - 드럼 FX에 특화
-        y_harmonic, y_percussive = librosa.effects.hpss(y)
-        # 타악기 성분의 에너지
-        percussive_energy = np.sum(y_percussive ** 2)
-        # 타악기/하모닉 비율
-        perc_harm_ratio = np.sum(y_percussive ** 2) / np.sum(y_harmonic ** 2) if np.sum(y_harmonic ** 2) > 0 else 1.0
-
-        # 6. 시간적 특성(Temporal Features)
-        # 소리의 어택(Attack) 특성
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        onset_mean = np.mean(onset_env)
-        onset_max = np.max(onset_env)
-
-        # 7. 변화율(Flux) - 인접 프레임간 스펙트럼 변화
-        spec = np.abs(librosa.stft(y))
-        flux = np.sum(np.diff(spec, axis=1) ** 2, axis=0)
-        flux_mean = np.mean(flux)
-
-        # 모든 특성 결합 및 정규화
-        features = np.concatenate([
-            fft_features,  # 기존 7개 특성
-            mfcc_mean, mfcc_var,  # MFCC 평균 및 분산 (26개)
-            contrast_mean,  # 스펙트럼 대비 (7개)
-            [centroid_mean, bandwidth_mean],  # 중심 및 대역폭 (2개)
-            [percussive_energy, perc_harm_ratio],  # 퍼커시브 특성 (2개)
-            [onset_mean, onset_max, flux_mean]  # 시간적 특성 (3개)
-        ])
-
-        return torch.tensor(features)
-
+        y, sr = librosa.load(path, sr=None)
+        return compute_enhanced_from_signal(y, sr)
     except Exception as e:
         return False
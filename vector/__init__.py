@@ -1,63 +1,171 @@
 import librosa
 
-from .vanilla import compute_fft_descriptors
-from .utils import (norm_features, convert_mp3_to_wav,
-                    load_weight, save_weight, get_dist, norm_minmax)
-from glob import glob
+from .vanilla import compute_fft_descriptors, fft_descriptors_batch
+from .utils import (norm_features, convert_mp3_to_wav, load_weight, save_weight,
+                    get_dist, get_topk, drop_invalid, norm_minmax, batch_topk, batch_results,
+                    selective_rows)
 import torch, os, pickle
 from tqdm import tqdm
-from .MCFFvec import compute_enhanced_descriptors
+from .MCFFvec import compute_enhanced_descriptors, compute_enhanced_from_signal
+from .Attack import compute_attack_descriptors, compute_attack_from_signal
+from .ann import build_index, load_index
+from .pq import PQCodec
+from .index_file import open_index, write_index
+from .manifest import Manifest, file_entry
+from .loader import clip_loader, passt_embed
+from .extract import extract_features
+from .cache import QueryCache, index_version
+from .store import FeatureStore
+from .batcher import MicroBatcher
+from .cascade import CascadeSearch
+from .attributes import Attributes, row_mask
+from .shard import ShardSpec, ShardedSearch, ProcessShard, HTTPShard, list_audio, align_stats
+from .arena import PCMArena, ArenaExtractor, open_arena, check_arena
+from time import time
 from hear21passt.base import get_basic_model, get_model_passt
 
+EXTRACTORS = {
+    'fft': compute_fft_descriptors,
+    'mfcc': compute_enhanced_descriptors,
+    'attack': compute_attack_descriptors,
+}
+
+# 이미 decode 된 (y, sr) 을 받는 버전, cascade search 에서 query 를 한 번만 decode
+SIGNAL_EXTRACTORS = {
+    'fft': lambda y, sr: fft_descriptors_batch([y], [sr])[0],
+    'mfcc': compute_enhanced_from_signal,
+    'attack': compute_attack_from_signal,
+}
 
 
 class VanlillaDB:
-    def __init__(self, audio_dir, weights=None, method='fft'):
+    def __init__(self, audio_dir, weights=None, method='fft', chunk_size=16384, workers=1,
+                 cache=None, cache_results=False, store=None, shard=None, arena=None):
         self.audio_dir = audio_dir
         self.weight_path = weights
-        self.func = compute_fft_descriptors if method == 'fft' else compute_enhanced_descriptors
+        self.shard = shard
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.method = method
+        self.cache = cache
+        self.cache_results = cache_results
+        self.store = store
+        self.failures = {}
+        self._lookup = None
+        self.func = EXTRACTORS.get(method, compute_enhanced_descriptors)
+        if arena is not None:
+            # decode 된 PCM 을 arena 에서 바로 읽음
+            check_arena(arena, method)
+            self.func = ArenaExtractor(arena, method)
 
         if weights is not None and os.path.exists(weights):
-            self.paths, self.vecs, self.mean, self.std = load_weight(weights)
+            self.paths, self.vecs, self.max_val, self.min_val = load_weight(weights)
+            manifest = Manifest.load(weights)
+            self.alive = manifest.alive_mask(len(self.paths)) if manifest is not None else None
         else:
-            self.paths, self.vecs, self.mean, self.std = self.get_features()
+            self.paths, self.vecs, self.max_val, self.min_val = self.get_features()
+            self.alive = None
+        self.attributes = Attributes.load(weights)
+
+    def extract(self, paths):
+        """raw (un-normalised) features of the paths that did not fail, store hits are not re-extracted"""
+        def run(paths):
+            vecs, result_path, self.failures = extract_features(self.func, paths, self.workers)
+            return vecs, result_path
+        if self.store is None:
+            return run(paths)
+        return self.store.extract(self.method, paths, run)
 
     def get_features(self):
         print('initializing weights')
-        paths = sorted(glob(f"{self.audio_dir}/*.wav"))
-        entire = len(paths)
-        fail = 0
-        vecs = []
-        result_path = []
-        for path in tqdm(paths):
-            vec = self.func(path)
-            if vec is False :
-                fail += 1
-            else:
-                has_nan = vec.isnan().any()
-                if has_nan:
-                    fail+=1
+        paths = list_audio(self.audio_dir, self.shard)
+        vecs, result_path = self.extract(paths)
+        vecs, max_val, min_val = norm_minmax(vecs)
+        print(max_val,min_val)
+        save_weight(self.weight_path,result_path,vecs,max_val,min_val)
+        digests = self.store.digests(result_path) if self.store is not None else None
+        Manifest.from_paths(result_path,digests).save(self.weight_path)
+        return result_path, vecs, max_val, min_val
+
+    def update(self, compact_ratio=0.25):
+        """
+        Incrementally sync the index with audio_dir.
+
+        Only new or changed files are extracted. Deleted files are tombstoned
+        and masked out of the search; once more than ``compact_ratio`` of the
+        rows are dead the index is compacted. The min/max stats only ever
+        widen as files are added (existing rows are re-normalised to the new
+        range) and are recomputed exactly on compaction. A shard keeps its
+        stats as they are (the global ones after align_stats), so it stays
+        comparable with the other shards; new rows may fall slightly
+        outside [0, 1].
+        """
+        manifest = Manifest.load(self.weight_path) or Manifest.from_paths(self.paths)
+        added, changed, deleted = manifest.diff(self.audio_dir, self.shard)
+        print(f'added : {len(added)} , changed : {len(changed)} , deleted : {len(deleted)}')
+        if not (added or changed or deleted):
+            manifest.save(self.weight_path)
+            return
+        manifest.tombstone(changed + deleted)
+
+        paths = list(self.paths)
+        # max/min 으로 정규화된 값을 원래 scale 로 되돌림
+        raw = self.vecs * (self.max_val - self.min_val) + self.min_val
+        vecs, new_paths = self.extract(added + changed)
+        if new_paths:
+            # 같은 path 의 tombstone row 가 있으면 그 자리에 다시 씀
+            dead = {paths[row]: row for row in manifest.deleted}
+            appended = []
+            for path, vec in zip(new_paths, vecs):
+                row = dead.get(path)
+                if row is None:
+                    row = len(paths)
+                    appended.append(vec.to(raw.dtype))
+                    paths.append(path)
                 else:
-                    vecs.append(vec)
-                    result_path.append(path)
-        print(f'entire : {entire} , fail : {fail}')
-        vecs = torch.stack(vecs)
-        vecs, mean, std = norm_minmax(vecs)
-        print(mean,std)
-        save_weight(self.weight_path,result_path,vecs,mean,std)
-        print(f'entire : {entire} , fail : {fail}')
-        return paths, vecs, mean, std
+                    raw[row] = vec
+                    manifest.deleted.discard(row)
+                manifest.files[path] = file_entry(path, row, self.digest(path))
+            if appended:
+                raw = torch.cat((raw, torch.stack(appended)))
+            vecs = vecs.to(raw.dtype)
+            if self.shard is None:
+                self.max_val = torch.maximum(self.max_val, vecs.max(dim=0).values)
+                self.min_val = torch.minimum(self.min_val, vecs.min(dim=0).values)
+
+        if manifest.deleted and len(manifest.deleted) > compact_ratio * len(paths):
+            print(f'compacting {len(manifest.deleted)} deleted rows')
+            keep = manifest.compact(len(paths))
+            raw = raw[torch.tensor(keep)]
+            paths = [path for path, alive in zip(paths, keep) if alive]
+            if self.shard is None:
+                _, self.max_val, self.min_val = norm_minmax(raw)
+
+        self.vecs = self.normalize(raw)
+        self.paths = paths
+        self.alive = manifest.alive_mask(len(paths))
+        save_weight(self.weight_path,paths,self.vecs,self.max_val,self.min_val)
+        manifest.save(self.weight_path)
+        if self.attributes is not None:
+            # row 번호가 바뀌었으므로 같은 meta 파일로 다시 만듦
+            self.index_attributes(self.attributes.sources)
+
+    def index_attributes(self, meta_paths):
+        """Build attributes.npz (bpm/key/tags/collection per row) from samples_meta json files"""
+        self.attributes = Attributes.build(list(self.paths), meta_paths)
+        self.attributes.save(self.weight_path)
+
+    def digest(self, path):
+        return self.store.content_hash(path) if self.store is not None else None
 
     def sort(self,paths,x):
-        indices = []
-        for path in paths:
-            try :
-                idx = self.paths.index(path)
-                indices.append(idx)
-            except:
-                continue
+        indices = self.rows(paths)
+        indices = indices[indices >= 0]
+        if self.alive is not None:
+            indices = indices[self.alive[indices]]
+        indices = indices.tolist()
         vecs = self.vecs[indices]
-        x = (self.func(x)-self.std)/(self.mean-self.std)
+        x = self.query_vector(x)
         value, idxs = get_dist(vecs,x)
         result = []
         for idx in idxs:
@@ -65,78 +173,415 @@ class VanlillaDB:
         return result
 
 
-    def get_k_sims(self,x,k=10):
-        x = (self.func(x) - self.std) / (self.mean - self.std)
-        value, idxs = get_dist(self.vecs,x)
+    def normalize(self, vec):
+        """min/max normalisation of raw descriptors, the same one the rows went through"""
+        return (vec - self.min_val) / (self.max_val - self.min_val)
+
+    def rows(self, paths):
+        """row of every path (-1 when it is not indexed), one dict lookup per path"""
+        if self._lookup is None or self._lookup[0] is not self.paths:
+            self._lookup = (self.paths, {path: row for row, path in enumerate(self.paths)})
+        lookup = self._lookup[1]
+        return torch.tensor([lookup.get(path, -1) for path in paths], dtype=torch.long)
+
+    def query_vector(self, x, decoded=None):
+        """
+        normalised descriptor vector of the query file x (raw features are cached).
+        decoded: () -> (y, sr) of x at the native rate, used instead of reading x on a miss
+        """
+        compute = (lambda: SIGNAL_EXTRACTORS[self.method](*decoded())) if decoded is not None else (lambda: self.func(x))
+        if self.cache is None:
+            vec = compute()
+        else:
+            vec = self.cache.get_or_compute(QueryCache.key(x, self.method), compute)
+        return self.normalize(vec)
+
+    def query_vector_from_signal(self, y, sr):
+        """normalised descriptor vector of an already decoded query (native sr)"""
+        return self.normalize(SIGNAL_EXTRACTORS[self.method](y, sr))
+
+    def get_k_sims(self,x,k=10,exact=False,where=None):
+        """
+        where filters the rows before scoring, e.g.
+        {'bpm': (120, 130), 'key': 'A minor', 'tags': ['drums'], 'collection': 12}
+        """
+        key = None
+        if self.cache is not None and self.cache_results:
+            key = QueryCache.key(x, f'{self.method}-topk', k=k, exact=exact, where=where,
+                                 index=index_version(self.weight_path))
+            result = self.cache.get(key)
+            if result is not None:
+                return result
+        valid = row_mask(self.alive, self.attributes, where)
+        x = self.query_vector(x)
+        if exact:
+            value, idxs = drop_invalid(*get_dist(self.vecs,x),valid)
+        else:
+            value, idxs = get_topk(self.vecs,x,k,self.chunk_size,valid)
         paths = []
         values = []
-        for i in range(k):
+        for i in range(min(k,len(idxs))):
             paths.append(self.paths[idxs[i]])
             values.append(value[i])
+        if key is not None:
+            self.cache.put(key, (paths, values))
         return paths, values
 
+    def get_k_sims_batch(self, queries, k=10, metric='cosine', where=None):
+        """
+        get_k_sims for many queries at once (query files or a Q x D tensor of
+        normalised descriptors), scored block-wise with batch_topk.
+        metric is 'cosine', 'ip' or 'l1' (same ranking as get_k_sims).
+        """
+        if not isinstance(queries, torch.Tensor):
+            queries = torch.stack([self.query_vector(x) for x in queries])
+        valid = row_mask(self.alive, self.attributes, where)
+        values, idxs = batch_topk(self.vecs, queries, k, metric, self.chunk_size, valid=valid)
+        return batch_results(self.paths, values, idxs)
+
 
 
 
 
 class NNDB:
-    def __init__(self,audio_dir, weights=None):
+    def __init__(self,audio_dir, weights=None, chunk_size=16384, ann=None, nlist=1024, nprobe=8,
+                 pq_m=None, rerank=100, batch_size=16, num_workers=4, max_seconds=10,
+                 cache=None, cache_results=False, store=None, shard=None, arena=None):
         self.audio_dir = audio_dir
+        self.shard = shard
+        if arena is not None:
+            check_arena(arena, 'passot')
+        self.arena = arena
+        self.store = store
+        self.cache = cache
+        self.cache_results = cache_results
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.max_seconds = max_seconds
+        self.chunk_size = chunk_size
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.index = None
+        self.alive = None
+        self.pq, self.codes = None, None
+        self.forward_counts = {'forwards': 0, 'clips': 0}
         self.model = get_basic_model(mode='embed_only')
         self.model.eval()
         self.device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
         self.model = self.model.to(self.device)
         self.weights = weights
 
-        if weights is not None and os.path.exists(weights):
-            self.tensor = torch.load(f'{weights}/tensor.pt',map_location=self.device)
-            self.paths = pickle.load(open(f'{weights}/paths.pkl','rb'))
+        if weights is not None and os.path.exists(f'{weights}/pq.pt'):
+            # pq codes 만 메모리에 두고, 원본 벡터는 re-ranking 용으로 disk 에 mmap
+            self.pq, self.codes = PQCodec.load(f'{weights}/pq.pt',map_location=self.device)
+            self.tensor, self.paths = self.load_embeddings(mmap=True)
+        elif weights is not None and os.path.exists(weights):
+            self.tensor, self.paths = self.load_embeddings()
         else:
             if not os.path.exists(weights):
                 os.mkdir(weights)
             self.tensor, self.paths = self.compute_embeddings()
 
+        manifest = Manifest.load(weights) if weights is not None else None
+        if manifest is not None:
+            self.alive = manifest.alive_mask(len(self.paths))
+        self.attributes = Attributes.load(weights)
+
+        # ann index 는 paths.pkl 옆에 ann.pt 로 저장
+        if weights is not None and os.path.exists(f'{weights}/ann.pt'):
+            self.index = load_index(f'{weights}/ann.pt',map_location=self.device)
+        elif ann is not None:
+            self.index = build_index(ann,self.tensor,nlist=nlist,nprobe=nprobe)
+            self.index.save(f'{weights}/ann.pt')
+
+        if pq_m is not None and self.pq is None:
+            self.pq = PQCodec.train(self.tensor,m=pq_m)
+            self.codes = self.pq.encode(self.tensor)
+            self.pq.save(f'{weights}/pq.pt',self.codes)
+            self.tensor, self.paths = self.load_embeddings(mmap=True)
+
+    def load_embeddings(self,mmap=False):
+        """
+        (tensor, paths) from the weights dir.
+
+        index.bin is memory-mapped, so on cpu the tensor is a zero-copy view of
+        the file. mmap=True keeps it on disk (cpu) even when self.device is
+        cuda. Falls back to the old tensor.pt + paths.pkl pair.
+        """
+        if os.path.exists(f'{self.weights}/index.bin'):
+            index = open_index(f'{self.weights}/index.bin')
+            tensor = index.vecs if mmap else index.vecs.to(self.device)
+            return tensor, index.paths
+        map_location = 'cpu' if mmap else self.device
+        tensor = torch.load(f'{self.weights}/tensor.pt',map_location=map_location,mmap=mmap)
+        paths = pickle.load(open(f'{self.weights}/paths.pkl','rb'))
+        return tensor, paths
+
     def compute_embeddings(self):
-        paths = sorted(glob(f'{self.audio_dir}/*.wav'))
-        results = []
-        return_paths = []
-        fail = 0
-        for path in tqdm(paths):
-            y,sr = librosa.load(path,sr=32000)
-            y = torch.from_numpy(y).unsqueeze(0).to('cuda')
-            try:
-                with torch.no_grad():
-                    embedding = self.model(y)
-            except:
-                fail+=1
-                continue
-            results.append(embedding.squeeze(0))
-            return_paths.append(path)
-        print(f'fail: {fail}')
-        with open(self.weights+'/paths.pkl','wb') as f:
-            pickle.dump(return_paths,f)
+        paths = list_audio(self.audio_dir,self.shard)
+        results, return_paths = self.embed_files(paths)
         embeddings = torch.stack(results)
-        torch.save(embeddings,f'{self.weights}/tensor.pt')
+        write_index(f'{self.weights}/index.bin',embeddings,return_paths)
+        digests = self.store.digests(return_paths) if self.store is not None else None
+        Manifest.from_paths(return_paths,digests).save(self.weights)
         return embeddings , return_paths
 
+    def embed_files(self,paths):
+        """PaSST embeddings of paths, in path order, skipping failures and reusing store hits"""
+        if self.store is None:
+            return self.run_model(paths)
+        vecs, return_paths = self.store.extract(f'passot:{self.max_seconds}',paths,self.run_model)
+        return list(vecs.to(self.device)), return_paths
+
     @torch.no_grad()
-    def get_k_sims(self,x,k=10):
+    def run_model(self,paths):
+        """
+        PaSST embeddings of paths, in path order, skipping failures.
+
+        Clips are decoded/resampled in DataLoader workers, cropped to
+        max_seconds and zero-padded to a few fixed bucket lengths
+        (loader.BUCKET_SECONDS), so one-shots of any length fill real
+        batches and every embedding equals passt_embed of the clip alone.
+        The loader prefetches the next batches while the model runs on the
+        current one. The mean model batch fill is printed at the end.
+        """
+        loader = clip_loader(paths,sr=32000,batch_size=self.batch_size,num_workers=self.num_workers,
+                             max_seconds=self.max_seconds,pin_memory=self.device.type=='cuda',arena=self.arena)
+        embeddings = {}
+        fail = 0
+        forwards, batched = 0, 0
+        start = time()
+        for groups, failed in tqdm(loader):
+            fail += len(failed)
+            for positions, batch in groups:
+                batch = batch.to(self.device,non_blocking=True)
+                forwards += 1
+                batched += len(positions)
+                try:
+                    out = self.model(batch)
+                except Exception:
+                    # batch 전체가 실패하면 clip 단위로 다시 시도
+                    out = []
+                    for pos, y in zip(list(positions), batch):
+                        try:
+                            out.append(self.model(y.unsqueeze(0)).squeeze(0))
+                        except Exception:
+                            positions.remove(pos)
+                            fail += 1
+                for pos, embedding in zip(positions, out):
+                    embeddings[pos] = embedding
+        elapsed = time() - start
+        print(f'fail: {fail}, {len(paths) / max(elapsed, 1e-6):.1f} clips/sec, '
+              f'{batched / max(forwards, 1):.1f} clips per forward ({batched / max(forwards * self.batch_size, 1):.0%} fill)')
+        order = sorted(embeddings)
+        return [embeddings[i] for i in order], [paths[i] for i in order]
+
+    @torch.no_grad()
+    def update(self,compact_ratio=0.25):
+        """
+        Incrementally sync the index with audio_dir.
+
+        Only new or changed files are embedded. Deleted files are tombstoned,
+        so row ids in ann.pt / pq.pt stay valid without retraining, and are
+        compacted away once more than ``compact_ratio`` of the rows are dead.
+        New rows are assigned to the existing ivf lists and encoded with the
+        existing pq codebooks.
+        """
+        manifest = Manifest.load(self.weights) or Manifest.from_paths(self.paths)
+        added, changed, deleted = manifest.diff(self.audio_dir, self.shard)
+        print(f'added : {len(added)} , changed : {len(changed)} , deleted : {len(deleted)}')
+        if not (added or changed or deleted):
+            manifest.save(self.weights)
+            return
+        manifest.tombstone(changed + deleted)
+
+        paths = list(self.paths)
+        tensor = self.tensor.clone()
+        embeddings, new_paths = self.embed_files(added + changed)
+        if embeddings:
+            # 같은 path 의 tombstone row 가 있으면 그 자리에 다시 씀
+            dead = {paths[row]: row for row in manifest.deleted}
+            rows, appended = [], []
+            for path, embedding in zip(new_paths, embeddings):
+                row = dead.get(path)
+                if row is None:
+                    row = len(paths)
+                    appended.append(embedding)
+                    paths.append(path)
+                else:
+                    tensor[row] = embedding
+                    manifest.deleted.discard(row)
+                rows.append(row)
+                manifest.files[path] = file_entry(path, row, self.digest(path))
+            if appended:
+                tensor = torch.cat((tensor, torch.stack(appended).to(tensor)))
+            embeddings = torch.stack(embeddings)
+            if self.index is not None:
+                self.index.update(rows, embeddings)
+            if self.pq is not None:
+                codes = self.pq.encode(embeddings.to(self.codes.device))
+                self.codes = torch.cat((self.codes, self.codes.new_zeros((len(appended), self.pq.m))))
+                self.codes[torch.tensor(rows, device=self.codes.device)] = codes
+
+        if manifest.deleted and len(manifest.deleted) > compact_ratio * len(paths):
+            print(f'compacting {len(manifest.deleted)} deleted rows')
+            keep = torch.tensor(manifest.compact(len(paths)))
+            tensor = tensor[keep.to(tensor.device)]
+            paths = [path for path, alive in zip(paths, keep.tolist()) if alive]
+            if self.index is not None:
+                self.index.compact(keep)
+            if self.pq is not None:
+                self.codes = self.codes[keep.to(self.codes.device)]
+
+        write_index(f'{self.weights}/index.bin',tensor,paths)
+        manifest.save(self.weights)
+        if self.index is not None:
+            self.index.save(f'{self.weights}/ann.pt')
+        if self.pq is not None:
+            self.pq.save(f'{self.weights}/pq.pt',self.codes)
+        self.tensor, self.paths = self.load_embeddings(mmap=self.pq is not None)
+        self.alive = manifest.alive_mask(len(paths))
+        if self.attributes is not None:
+            # row 번호가 바뀌었으므로 같은 meta 파일로 다시 만듦
+            self.index_attributes(self.attributes.sources)
+
+    def index_attributes(self,meta_paths):
+        """Build attributes.npz (bpm/key/tags/collection per row) from samples_meta json files"""
+        self.attributes = Attributes.build(list(self.paths),meta_paths)
+        self.attributes.save(self.weights)
+
+    def digest(self,path):
+        return self.store.content_hash(path) if self.store is not None else None
+
+    def load_query(self,x):
+        """first 5 seconds of the query file x at 32kHz"""
         y, sr = librosa.load(x,sr=32000,duration=5)
-        x = self.model(torch.from_numpy(y).to(self.device).unsqueeze(0)).squeeze(0)
-        value, idxs = get_dist(self.tensor,x)
+        return torch.from_numpy(y)
+
+    def embed_signal(self,y,sr):
+        """embedding of an already decoded query, cropped/resampled like load_query"""
+        y = y[:int(5 * sr)]
+        if sr != 32000:
+            y = librosa.resample(y,orig_sr=sr,target_sr=32000)
+        return self.embed_clips([torch.from_numpy(y)])[0]
+
+    def embedding_key(self,x):
+        return QueryCache.key(x,'passot',sr=32000,duration=5)
+
+    def embed_clips(self,clips):
+        """
+        PaSST embeddings of several decoded clips (see loader.passt_embed).
+        Clips are padded to fixed bucket lengths, so concurrent queries
+        share a forward pass when they fall in the same bucket (a 5 second
+        query crop spans at most four). ``forward_counts`` keeps the
+        forward passes run and the clips in them.
+        """
+        return passt_embed(self.model,clips,self.device,self.forward_counts)
+
+    def embed(self,x,decoded=None):
+        """
+        PaSST embedding of the first 5 seconds of the query file x (cached).
+        decoded: () -> (y, sr) of x, used instead of reading x on a miss
+        """
+        if decoded is not None:
+            compute = lambda: self.embed_signal(*decoded())
+        else:
+            compute = lambda: self.embed_clips([self.load_query(x)])[0]
+        if self.cache is None:
+            return compute()
+        return self.cache.get_or_compute(self.embedding_key(x),lambda: compute().cpu()).to(self.device)
+
+    @torch.no_grad()
+    def get_k_sims(self,x,k=10,exact=False,nprobe=None,rerank=None,where=None):
+        key = None
+        if self.cache is not None and self.cache_results:
+            key = QueryCache.key(x,'passot-topk',k=k,exact=exact,nprobe=nprobe,rerank=rerank,where=where,
+                                 index=index_version(self.weights))
+            result = self.cache.get(key)
+            if result is not None:
+                return result
+        x = self.embed(x)
+        value, idxs = self.search(x,k,exact,nprobe,rerank,where)
         paths = []
         values = []
-        for i in range(k):
+        for i in range(min(k,len(idxs))):
             paths.append(self.paths[idxs[i]])
             values.append(value[i])
+        if key is not None:
+            self.cache.put(key,(paths,values))
         return paths, values
 
+    @torch.no_grad()
+    def get_k_sims_batch(self,queries,k=10,metric='cosine',where=None):
+        """
+        get_k_sims for many queries at once (query files or a Q x D tensor of
+        embeddings). Queries are embedded batch_size at a time and scored
+        against every row with batch_topk (exact scan, the ann index is not
+        used). metric is 'cosine', 'ip' or 'l1'.
+        """
+        if not isinstance(queries, torch.Tensor):
+            embeddings = []
+            for i in range(0,len(queries),self.batch_size):
+                embeddings += self.embed_clips([self.load_query(x) for x in queries[i:i+self.batch_size]])
+            queries = torch.stack(embeddings)
+        valid = row_mask(self.alive,self.attributes,where)
+        values, idxs = batch_topk(self.tensor,queries,k,metric,self.chunk_size,valid=valid)
+        return batch_results(self.paths,values,idxs)
+
+    def search(self,x,k=10,exact=False,nprobe=None,rerank=None,where=None):
+        """
+        Top-k rows for an embedding x.
+
+        Uses the ann index when one is loaded, and falls back to the chunked
+        exact scan when there is none or the probed lists hold fewer than k
+        rows. With pq codes the candidates are scored from the codes and the
+        best ``rerank`` of them are re-scored against the full vectors.
+        exact=True keeps the old full get_dist ordering.
+
+        ``where`` (see Attributes.mask) is applied before scoring: probed ivf
+        lists are filtered by it, and a selective filter skips the ann index
+        and scores only the matching rows.
+        """
+        valid = row_mask(self.alive,self.attributes,where)
+        if exact:
+            return drop_invalid(*get_dist(self.tensor,x.to(self.tensor.device)),valid)
+        ids = selective_rows(valid) if where else None
+        if ids is None and self.index is not None:
+            ids = self.index.probe(x,nprobe or self.nprobe)
+            if valid is not None:
+                ids = ids[valid.to(ids.device)[ids]]
+            if len(ids) < min(k,len(self.paths)):
+                ids = None
+        if self.pq is not None:
+            return self.pq_search(x,k,ids,rerank,valid)
+        if ids is not None:
+            ids = ids.to(self.tensor.device)
+            value, idxs = get_topk(self.tensor[ids],x.to(self.tensor.device),k)
+            return value, ids[idxs]
+        return get_topk(self.tensor,x,k,self.chunk_size,valid)
+
+    def pq_search(self,x,k=10,ids=None,rerank=None,valid=None):
+        rerank = self.rerank if rerank is None else rerank
+        if ids is None:
+            value, idxs = self.pq.search(self.codes,x,max(k,rerank),self.chunk_size,valid)
+        else:
+            value, idxs = self.pq.search(self.codes[ids],x,max(k,rerank),self.chunk_size)
+            idxs = ids[idxs]
+        if rerank <= 0:
+            return value[:k], idxs[:k]
+        # shortlist 를 row 순서로 읽어서 disk 접근을 순차적으로
+        rows = torch.sort(idxs).values.cpu()
+        value, order = get_topk(self.tensor[rows].to(x.device),x,k)
+        return value, rows[order.cpu()]
+
 
-def hierarchical_search(nndb,spdb,x):
-    paths, values = nndb.get_k_sims(x,k=100)
-    result = spdb.sort(paths,x)
-    k = min(len(result),10)
-    return result[:k]
+def hierarchical_search(nndb,spdb,x,k=10,candidates=100):
+    """top 100 PaSST hits re-ranked by the spdb descriptors (see CascadeSearch, cached like get_k_sims)"""
+    engine = getattr(nndb,'cascade',None)
+    if engine is None or engine.spdb is not spdb:
+        engine = nndb.cascade = CascadeSearch(nndb,spdb,candidates,k)
+    paths, values = engine.search(x,k,candidates)
+    return paths
 
 
 
@@ -0,0 +1,139 @@
+import torch
+from .utils import get_topk
+
+
+def assign_clusters(x, centroids, chunk_size=16384):
+    """각 row 에 가장 가까운(L2) centroid 번호를 반환"""
+    assign = torch.empty(x.shape[0], dtype=torch.long, device=x.device)
+    for start in range(0, x.shape[0], chunk_size):
+        dist = torch.cdist(x[start:start+chunk_size].float(), centroids)
+        assign[start:start+chunk_size] = dist.argmin(dim=1)
+    return assign
+
+
+def kmeans(x, n_clusters, n_iter=20, max_train=None, seed=0):
+    """
+    Lloyd k-means on the rows of x.
+
+    Args:
+        x (torch.Tensor): N x D training vectors
+        n_clusters (int): number of centroids (clipped to N)
+        n_iter (int): Lloyd iterations
+        max_train (int): train on a random subset of at most this many rows
+        seed (int): seed for the subset / initial centroid draw
+
+    Returns:
+        torch.Tensor: n_clusters x D float32 centroids on x's device
+    """
+    generator = torch.Generator().manual_seed(seed)
+    if max_train is not None and x.shape[0] > max_train:
+        x = x[torch.randperm(x.shape[0], generator=generator)[:max_train]]
+    x = x.float()
+    n_clusters = min(n_clusters, x.shape[0])
+    centroids = x[torch.randperm(x.shape[0], generator=generator)[:n_clusters]].clone()
+    for _ in range(n_iter):
+        assign = assign_clusters(x, centroids)
+        sums = torch.zeros_like(centroids).index_add_(0, assign, x)
+        counts = torch.bincount(assign, minlength=n_clusters)
+        # 비어버린 cluster 는 이전 centroid 를 유지
+        centroids = torch.where((counts == 0).unsqueeze(1), centroids,
+                                sums / counts.clamp(min=1).unsqueeze(1))
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index with a k-means coarse quantiser.
+
+    Rows are bucketed by their nearest centroid. A query only scans the rows
+    of the ``nprobe`` closest buckets, so ``nprobe`` trades recall for latency
+    (``nprobe == nlist`` is an exact scan). Distances inside the probed lists
+    are the same L1 distances ``get_topk`` uses.
+    """
+    name = 'ivf'
+
+    def __init__(self, centroids, order, offsets, nprobe=8):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, vecs, nlist=1024, n_iter=20, nprobe=8):
+        print(f'building ivf index (nlist={nlist})')
+        centroids = kmeans(vecs, nlist, n_iter=n_iter, max_train=nlist * 256)
+        index = cls(centroids, None, None, nprobe)
+        index.set_lists(assign_clusters(vecs, centroids))
+        return index
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    def set_lists(self, assign):
+        """Rebuild the inverted lists from a per-row list assignment"""
+        self.order = torch.argsort(assign, stable=True)
+        counts = torch.bincount(assign, minlength=self.nlist)
+        self.offsets = torch.zeros(self.nlist + 1, dtype=torch.long, device=counts.device)
+        self.offsets[1:] = torch.cumsum(counts, dim=0)
+
+    def assignments(self):
+        """Per-row list number (inverse of set_lists)"""
+        counts = self.offsets[1:] - self.offsets[:-1]
+        assign = torch.empty_like(self.order)
+        assign[self.order] = torch.repeat_interleave(
+            torch.arange(self.nlist, device=counts.device), counts)
+        return assign
+
+    def update(self, rows, vecs):
+        """
+        Re-assign ``rows`` to their nearest list with the trained centroids.
+        Rows past the current end are appended (they must be contiguous).
+        """
+        assign = self.assignments()
+        n = max(assign.shape[0], max(rows) + 1)
+        if n > assign.shape[0]:
+            assign = torch.cat((assign, assign.new_zeros(n - assign.shape[0])))
+        assign[torch.as_tensor(rows, device=assign.device)] = \
+            assign_clusters(vecs.to(self.centroids.device), self.centroids).to(assign.device)
+        self.set_lists(assign)
+
+    def compact(self, keep):
+        """Drop rows where ``keep`` is False and renumber the rest"""
+        keep = torch.as_tensor(keep, dtype=torch.bool, device=self.order.device)
+        self.set_lists(self.assignments()[keep])
+
+    def probe(self, x, nprobe=None):
+        """Row ids stored in the ``nprobe`` lists closest to x"""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        dist = torch.cdist(x.reshape(1, -1).float().to(self.centroids.device), self.centroids).reshape(-1)
+        lists = torch.topk(dist, nprobe, largest=False).indices.tolist()
+        offsets = self.offsets.tolist()
+        return torch.cat([self.order[offsets[l]:offsets[l+1]] for l in lists]).to(x.device)
+
+    def search(self, db, x, k=10, nprobe=None):
+        ids = self.probe(x, nprobe)
+        value, idx = get_topk(db[ids], x, k)
+        return value, ids[idx]
+
+    def save(self, path):
+        torch.save({'type': self.name, 'centroids': self.centroids, 'order': self.order,
+                    'offsets': self.offsets, 'nprobe': self.nprobe}, path)
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state['centroids'], state['order'], state['offsets'], state['nprobe'])
+
+
+ANN_INDEXES = {
+    'ivf': IVFIndex,
+}
+
+
+def build_index(kind, vecs, **kwargs):
+    return ANN_INDEXES[kind].build(vecs, **kwargs)
+
+
+def load_index(path, map_location=None):
+    state = torch.load(path, map_location=map_location)
+    return ANN_INDEXES[state['type']].from_state(state)
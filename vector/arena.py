@@ -0,0 +1,217 @@
+"""
+Decoded audio cache.
+
+Every clip of a library is decoded once into one flat PCM file
+(``{arena}/pcm.bin``, float32 or float16, mono) and a table
+(``{arena}/table.npz``) records each path's offset, length and sample
+rate. ``PCMArena.clip`` memory-maps the file and returns a slice of it,
+so extractors read samples straight from the page cache without opening,
+parsing or resampling the wav. Re-extracting features after a descriptor
+change is then bound by compute instead of decoding and file I/O.
+
+    arena = PCMArena.build('arena dir', list_audio('wav dir'))
+    y, sr = arena.clip('wav dir/x.wav')
+
+``sr=None`` keeps every clip at its native rate (fft/mfcc features stay
+bit-identical to librosa.load(path, sr=None) with float32). A fixed ``sr``
+resamples once at build time. Queries are always read from the file, so a
+method may only use an arena that gives it the same signal: float32 at
+the native rate or at the rate the extractor reads (``compatible``).
+Features are stored without the arena in their key, which is why a
+resampled / float16 arena is refused rather than tracked.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import librosa
+from tqdm import tqdm
+
+
+def compatible(sr, dtype, method):
+    """True when an arena of (sr, dtype) gives method the signal it would load from the file"""
+    from .pipeline import RATES
+    return np.dtype(dtype) == np.float32 and sr in (None, RATES[method])
+
+
+def check_arena(arena, method):
+    if not compatible(arena.sr, arena.dtype, method):
+        raise ValueError(f'{method} cannot use a {arena.dtype.name} arena at sr={arena.sr}: '
+                         f'its queries are read from the files (use a float32 arena at the native rate)')
+
+
+def decode_file(path, sr=None):
+    """mono float32 signal like librosa.load(path, sr=sr)"""
+    y, native_sr = librosa.load(path, sr=sr)
+    return y, native_sr if sr is None else sr
+
+
+class PCMArena:
+    """
+    Packed PCM of many clips behind an offsets / lengths table.
+
+    Rows also keep the file size and mtime they were decoded from, so
+    ``update`` re-decodes only new or changed files. Updates append to
+    pcm.bin; the samples of replaced clips stay in the file until the next
+    ``build``. Pickling keeps only the directory, every process maps the
+    file itself (DataLoader / ProcessPoolExecutor workers).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        table = np.load(f'{root}/table.npz')
+        self.paths = table['paths'].tolist()
+        self.offsets = table['offsets']
+        self.lengths = table['lengths']
+        self.srs = table['srs']
+        self.sizes = table['sizes']
+        self.mtimes = table['mtimes']
+        self.dtype = np.dtype(str(table['dtype']))
+        self.sr = int(table['sr']) or None
+        self.rows = {path: row for row, path in enumerate(self.paths)}
+        self.pcm = None
+
+    def __getstate__(self):
+        return {'root': self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state['root'])
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, path):
+        return self.key(path) in self.rows
+
+    @staticmethod
+    def key(path):
+        return os.path.abspath(path)
+
+    def open(self):
+        if self.pcm is None:
+            size = os.path.getsize(f'{self.root}/pcm.bin') // self.dtype.itemsize
+            self.pcm = np.memmap(f'{self.root}/pcm.bin', dtype=self.dtype, mode='r', shape=(size,)) if size else np.empty(0, self.dtype)
+        return self.pcm
+
+    def clip(self, path, max_seconds=None):
+        """
+        (signal, sr) of path as a read-only view into the arena (a float32
+        copy when the arena is float16), None when the path is not cached.
+        """
+        row = self.rows.get(self.key(path))
+        if row is None:
+            return None
+        sr = int(self.srs[row])
+        n = int(self.lengths[row])
+        if max_seconds is not None:
+            n = min(n, int(max_seconds * sr))
+        y = self.open()[self.offsets[row]:self.offsets[row] + n]
+        if self.dtype != np.float32:
+            y = y.astype(np.float32)
+        return y, sr
+
+    def load(self, path, sr=None, max_seconds=None):
+        """like librosa.load(path, sr=sr, duration=max_seconds), from the arena when cached"""
+        cached = self.clip(path, max_seconds)
+        if cached is None:
+            y, native_sr = librosa.load(path, sr=sr, duration=max_seconds)
+            return y, native_sr
+        y, native_sr = cached
+        if sr is not None and sr != native_sr:
+            y = librosa.resample(y, orig_sr=native_sr, target_sr=sr)
+        return y, sr or native_sr
+
+    def stale(self, paths):
+        """paths that are new or whose size / mtime changed since they were decoded"""
+        stale = []
+        for path in paths:
+            row = self.rows.get(self.key(path))
+            st = os.stat(path)
+            if row is None or self.sizes[row] != st.st_size or self.mtimes[row] != st.st_mtime_ns:
+                stale.append(path)
+        return stale
+
+    @classmethod
+    def build(cls, root, paths, sr=None, dtype='float32', workers=8):
+        """Decode paths into a new arena at root (replacing an existing one)"""
+        os.makedirs(root, exist_ok=True)
+        for name in ('pcm.bin', 'table.npz'):
+            if os.path.exists(f'{root}/{name}'):
+                os.remove(f'{root}/{name}')
+        cls.save_table(root, [], [], [], [], [], [], sr, dtype)
+        open(f'{root}/pcm.bin', 'wb').close()
+        return cls(root).update(paths, workers=workers)
+
+    def update(self, paths, workers=8):
+        """Append the stale paths (see ``stale``) to pcm.bin, returns the reopened arena"""
+        stale = self.stale(paths)
+        table = {path: (self.offsets[row], self.lengths[row], self.srs[row], self.sizes[row], self.mtimes[row])
+                 for path, row in self.rows.items()}
+        if not stale:
+            return self
+        print(f'arena : decoding {len(stale)} of {len(paths)} files')
+        offset = os.path.getsize(f'{self.root}/pcm.bin') // self.dtype.itemsize
+        fail = 0
+
+        def work(path):
+            try:
+                st = os.stat(path)
+                y, sr = decode_file(path, self.sr)
+                return path, y.astype(self.dtype), sr, st
+            except Exception:
+                return path, None, None, None
+        with open(f'{self.root}/pcm.bin', 'ab') as f, ThreadPoolExecutor(workers) as executor, \
+                tqdm(total=len(stale), desc='decoding') as pbar:
+            # chunk 단위로 넘겨서 decode 된 clip 이 메모리에 쌓이지 않게 함, pcm.bin 순서는 path 순서
+            for start in range(0, len(stale), workers * 4):
+                for path, y, sr, st in executor.map(work, stale[start:start + workers * 4]):
+                    pbar.update(1)
+                    if y is None:
+                        fail += 1
+                        continue
+                    f.write(y.tobytes())
+                    table[self.key(path)] = (offset, len(y), sr, st.st_size, st.st_mtime_ns)
+                    offset += len(y)
+        if fail:
+            print(f'arena : {fail} files failed to decode')
+        keys = sorted(table)
+        columns = list(zip(*[table[key] for key in keys])) if keys else [[]] * 5
+        self.save_table(self.root, keys, *columns, self.sr, self.dtype)
+        return PCMArena(self.root)
+
+    @staticmethod
+    def save_table(root, paths, offsets, lengths, srs, sizes, mtimes, sr, dtype):
+        tmp = f'{root}/table.tmp.npz'
+        np.savez(tmp, paths=np.array(paths, dtype=str), offsets=np.array(offsets, dtype=np.int64),
+                 lengths=np.array(lengths, dtype=np.int64), srs=np.array(srs, dtype=np.int64),
+                 sizes=np.array(sizes, dtype=np.int64), mtimes=np.array(mtimes, dtype=np.int64),
+                 sr=np.int64(sr or 0), dtype=np.array(np.dtype(dtype).name))
+        os.replace(tmp, f'{root}/table.npz')
+
+
+def open_arena(root):
+    """PCMArena at root, None when root is None or holds no arena yet"""
+    if root is None or not os.path.exists(f'{root}/table.npz'):
+        return None
+    return PCMArena(root)
+
+
+class ArenaExtractor:
+    """
+    Picklable ``path -> vector`` for extract_features that runs
+    SIGNAL_EXTRACTORS[method] on the cached signal, and the file extractor
+    for paths missing from the arena.
+    """
+
+    def __init__(self, arena, method):
+        self.arena = arena
+        self.method = method
+
+    def __call__(self, path):
+        from . import EXTRACTORS, SIGNAL_EXTRACTORS
+        cached = self.arena.clip(path)
+        if cached is None:
+            return EXTRACTORS[self.method](path)
+        try:
+            return SIGNAL_EXTRACTORS[self.method](*cached)
+        except Exception:
+            return False
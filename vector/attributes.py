@@ -0,0 +1,182 @@
+import json, os
+import numpy as np
+import torch
+
+NOTES = {'C': 0, 'C#': 1, 'Db': 1, 'D': 2, 'D#': 3, 'Eb': 3, 'E': 4, 'F': 5, 'F#': 6, 'Gb': 6,
+         'G': 7, 'G#': 8, 'Ab': 8, 'A': 9, 'A#': 10, 'Bb': 10, 'B': 11}
+MODES = {'major': 0, 'minor': 1}
+
+
+def parse_key(key):
+    """'A minor' / 'Am' / 'F# Major' / 'Eb' -> (pitch class, mode or None)"""
+    key = key.strip()
+    name = key[:2] if len(key) > 1 and key[1] in '#b' else key[:1]
+    rest = key[len(name):].strip().lower()
+    name = name[:1].upper() + name[1:]
+    if name not in NOTES:
+        raise ValueError(f'unknown key {key}')
+    root = NOTES[name]
+    if not rest:
+        return root, None
+    if rest in ('m', 'min', 'minor'):
+        return root, MODES['minor']
+    if rest in ('maj', 'major'):
+        return root, MODES['major']
+    raise ValueError(f'unknown key {key}')
+
+
+def sample_keys(sample):
+    """
+    (pitch class, mode) of every key of a samples_meta entry.
+
+    The meta lists a root and an explicit "Minor" entry for minor keys only,
+    so a root without "Minor" after it is major. An entry may list several
+    keys, each root starts a new one.
+    """
+    keys = []
+    for part in sample.get('key') or []:
+        name = part.get('name', '').strip()
+        if name in NOTES:
+            keys.append([NOTES[name], MODES['major']])
+        elif name.lower() in MODES and keys:
+            keys[-1][1] = MODES[name.lower()]
+    return [tuple(key) for key in keys]
+
+
+def key_bits(keys):
+    """bit root * 2 + mode set for every (root, mode) of keys"""
+    bits = 0
+    for root, mode in keys:
+        bits |= 1 << (root * 2 + mode)
+    return bits
+
+
+def load_samples(meta_paths):
+    """uuid -> sample from samples_meta json files"""
+    samples = {}
+    for path in meta_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for sample in json.load(f)['samples']:
+                samples[sample['uuid']] = sample
+    return samples
+
+
+class Attributes:
+    """
+    Per-row metadata arrays used to filter a search before scoring.
+
+    bpm (nan when unknown), keys (a 24 bit set of pitch class * 2 + mode,
+    0 when unknown) and collection (-1 when unknown) are one array each; tags are an inverted index (tag -> sorted
+    rows, CSR layout). ``mask`` turns a filter into a bool row mask with a
+    few vectorised comparisons, so it costs O(N) byte operations instead of
+    a Python loop over samples. Rows follow the index rows; the file stem
+    of a row's path is the sample uuid.
+    """
+
+    def __init__(self, bpm, keys, collection, tag_names, tag_offsets, tag_rows, sources=()):
+        self.bpm = bpm
+        self.keys = keys
+        self.collection = collection
+        self.tag_names = list(tag_names)
+        self.tag_offsets = tag_offsets
+        self.tag_rows = tag_rows
+        self.sources = list(sources)
+        self.tag_ids = {name: i for i, name in enumerate(self.tag_names)}
+
+    def __len__(self):
+        return len(self.bpm)
+
+    @classmethod
+    def build(cls, paths, meta_paths):
+        samples = load_samples(meta_paths)
+        n = len(paths)
+        bpm = np.full(n, np.nan, dtype=np.float32)
+        keys = np.zeros(n, dtype=np.int32)
+        collection = np.full(n, -1, dtype=np.int64)
+        tags = {}
+        for row, path in enumerate(paths):
+            sample = samples.get(os.path.splitext(os.path.basename(path))[0])
+            if sample is None:
+                continue
+            try:
+                bpm[row] = float(sample.get('bpm'))
+            except (TypeError, ValueError):
+                pass
+            keys[row] = key_bits(sample_keys(sample))
+            owner = sample.get('collection_id', sample.get('product_id'))
+            if owner is not None:
+                collection[row] = int(owner)
+            for tag in sample.get('tags') or []:
+                tags.setdefault(tag['name'].lower(), []).append(row)
+        tag_names = sorted(tags)
+        tag_offsets = np.zeros(len(tag_names) + 1, dtype=np.int64)
+        tag_offsets[1:] = np.cumsum([len(tags[name]) for name in tag_names])
+        tag_rows = np.array([row for name in tag_names for row in tags[name]], dtype=np.int64)
+        return cls(bpm, keys, collection, tag_names, tag_offsets, tag_rows,
+                   [os.path.abspath(p) for p in meta_paths])
+
+    def save(self, weights):
+        tmp = f'{weights}/attributes.tmp.npz'
+        np.savez(tmp, bpm=self.bpm, keys=self.keys,
+                 collection=self.collection, tag_names=np.array(self.tag_names, dtype=str),
+                 tag_offsets=self.tag_offsets, tag_rows=self.tag_rows, sources=np.array(self.sources, dtype=str))
+        os.replace(tmp, f'{weights}/attributes.npz')
+
+    @classmethod
+    def load(cls, weights):
+        path = f'{weights}/attributes.npz'
+        if weights is None or not os.path.exists(path):
+            return None
+        data = np.load(path)
+        if 'keys' in data:
+            keys = data['keys']
+        else:
+            # 예전 파일: root 하나와 mode (-1 은 "Minor" 가 없던 key, 즉 major)
+            root, mode = data['key_root'].astype(np.int32), data['key_mode'].astype(np.int32)
+            keys = np.where(root >= 0, 1 << (np.maximum(root, 0) * 2 + np.maximum(mode, 0)), 0).astype(np.int32)
+        return cls(data['bpm'], keys, data['collection'],
+                   data['tag_names'].tolist(), data['tag_offsets'], data['tag_rows'], data['sources'].tolist())
+
+    def tag_mask(self, tag):
+        mask = np.zeros(len(self), dtype=bool)
+        i = self.tag_ids.get(tag.lower())
+        if i is not None:
+            mask[self.tag_rows[self.tag_offsets[i]:self.tag_offsets[i+1]]] = True
+        return mask
+
+    def mask(self, bpm=None, key=None, tags=None, collection=None):
+        """
+        bool tensor of the rows matching every given filter.
+
+        Args:
+            bpm (tuple): (low, high) inclusive range
+            key (str): 'A minor', 'Am', 'C' (any mode) ...
+            tags (list): tag names, a row needs all of them
+            collection (int or list): collection ids
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if bpm is not None:
+            low, high = bpm
+            # nan 은 비교가 항상 False 라서 bpm 이 없는 row 는 빠짐
+            mask &= (self.bpm >= low) & (self.bpm <= high)
+        if key is not None:
+            root, mode = parse_key(key)
+            # mode 가 없으면 major / minor 둘 다
+            bits = 3 << (root * 2) if mode is None else 1 << (root * 2 + mode)
+            mask &= (self.keys & bits) != 0
+        for tag in tags or []:
+            mask &= self.tag_mask(tag)
+        if collection is not None:
+            collection = [collection] if np.isscalar(collection) else list(collection)
+            mask &= np.isin(self.collection, collection)
+        return torch.from_numpy(mask)
+
+
+def row_mask(alive, attributes, where=None):
+    """alive mask combined with the metadata filter ``where`` (dict of Attributes.mask kwargs)"""
+    if not where:
+        return alive
+    if attributes is None:
+        raise ValueError('filtered search needs attributes.npz (initialize.py --attributes)')
+    mask = attributes.mask(**where)
+    return mask if alive is None else mask & alive
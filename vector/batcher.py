@@ -0,0 +1,103 @@
+import asyncio
+from time import time
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into batched calls of ``fn``.
+
+    ``await submit(item)`` queues the item. A single worker task takes the
+    first waiting item, keeps collecting until ``max_batch`` items are queued
+    or ``max_wait`` seconds have passed since that first item, then runs
+    ``fn(items) -> results`` (in ``executor`` so the event loop stays free)
+    and hands every caller its own result. An exception from ``fn`` is
+    raised in every caller of that batch.
+
+    A call of ``fn`` may still split its items (PaSST runs one forward per
+    bucket length), so ``forward_counts`` (a dict with 'forwards' and
+    'clips' that fn keeps up to date) is where mean_batch / fill come
+    from; without it they are per call.
+    """
+
+    def __init__(self, fn, max_batch=16, max_wait=0.005, executor=None, forward_counts=None):
+        self.fn = fn
+        self.forward_counts = forward_counts
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.executor = executor
+        self.queue = None
+        self.worker = None
+        self.batches = 0
+        self.items = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def start(self):
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.get_running_loop().create_task(self.loop())
+
+    async def submit(self, item):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future, time()))
+        return await future
+
+    async def collect(self):
+        batch = [await self.queue.get()]
+        deadline = time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.collect()
+            start = time()
+            for _, _, queued in batch:
+                self.queue_seconds += start - queued
+                self.max_queue_seconds = max(self.max_queue_seconds, start - queued)
+            try:
+                results = await loop.run_in_executor(self.executor, self.fn, [item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            self.run_seconds += time() - start
+            self.batches += 1
+            self.items += len(batch)
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def stats(self):
+        batches = max(self.batches, 1)
+        items = max(self.items, 1)
+        forwards, batched = self.batches, self.items
+        if self.forward_counts is not None:
+            forwards, batched = self.forward_counts['forwards'], self.forward_counts['clips']
+        return {'batches': self.batches, 'items': self.items, 'forwards': forwards,
+                'mean_call': self.items / batches,
+                'mean_batch': batched / max(forwards, 1),
+                'fill': batched / (max(forwards, 1) * self.max_batch),
+                'mean_queue_ms': 1000 * self.queue_seconds / items,
+                'max_queue_ms': 1000 * self.max_queue_seconds,
+                'mean_run_ms': 1000 * self.run_seconds / batches}
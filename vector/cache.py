@@ -0,0 +1,114 @@
+import hashlib, json, os, sys
+from collections import OrderedDict
+from threading import Lock
+import torch
+from .manifest import content_hash
+
+
+def _sizeof(value):
+    """Approximate memory footprint of a cached value in bytes"""
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """
+    In-process LRU cache for query vectors and top-k results.
+
+    Keys are built from the blake2b hash of the audio bytes plus the method
+    and parameters (``QueryCache.key``), so a renamed or copied file still
+    hits and an edited file misses. Entries are evicted least recently used
+    first once ``max_bytes`` is exceeded. With ``disk_dir`` every entry is
+    also written there with torch.save and a memory miss falls back to it,
+    so the cache survives restarts.
+    """
+
+    def __init__(self, max_bytes=256 << 20, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(path, method, **params):
+        params = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.blake2b(f'{content_hash(path)}|{method}|{params}'.encode(), digest_size=16).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+        if self.disk_dir is not None and os.path.exists(f'{self.disk_dir}/{key}.pt'):
+            try:
+                value = torch.load(f'{self.disk_dir}/{key}.pt')
+            except Exception:
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self.lock:
+                    self.hits += 1
+                return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.disk_dir is not None:
+            tmp = f'{self.disk_dir}/{key}.pt.{os.getpid()}.tmp'
+            torch.save(value, tmp)
+            os.replace(tmp, f'{self.disk_dir}/{key}.pt')
+
+    def _remember(self, key, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    def get_or_compute(self, key, fn):
+        value = self.get(key)
+        if value is None:
+            value = fn()
+            if value is not None and value is not False:
+                self.put(key, value)
+        return value
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'entries': len(self.entries), 'bytes': self.nbytes, 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+
+# top-k 결과에 영향을 주는 weights dir 의 파일 (예전 형식 weight.pt / tensor.pt 포함)
+INDEX_FILES = ('index.bin', 'weight.pt', 'tensor.pt', 'attributes.npz', 'manifest.json', 'ann.pt', 'pq.pt')
+
+
+def index_version(weights):
+    """
+    Changes whenever a file of the index is rewritten: the vectors, the
+    filters (attributes.npz), the tombstones (manifest.json) or the ivf / pq
+    structures. Used to key cached top-k results
+    """
+    if weights is None or not os.path.isdir(weights):
+        return str(weights)
+    # 없는 파일은 '-' 로, 나중에 생기면 version 이 바뀜
+    mtimes = [str(os.stat(f'{weights}/{name}').st_mtime_ns) if os.path.exists(f'{weights}/{name}') else '-'
+              for name in INDEX_FILES]
+    return f"{os.path.abspath(weights)}:{':'.join(mtimes)}"
@@ -0,0 +1,77 @@
+import librosa
+import torch
+from .cache import QueryCache, index_version
+
+
+class CascadeSearch:
+    """
+    Two-stage retrieval: PaSST shortlist, descriptor re-rank.
+
+    The query embedding and descriptors go through ``nndb.cache`` /
+    ``spdb.cache`` like get_k_sims; on a miss the query file is decoded
+    once (native sample rate) and both stages work from that signal. With
+    ``nndb.cache_results`` the final top-k is cached as well, keyed on both
+    index versions. Stage one takes the ``candidates`` best rows of
+    ``nndb`` (ann / pq / exact, whatever the NNDB is configured with), stage
+    two maps them to ``spdb`` rows through a precomputed row table and
+    re-ranks just that shortlist by L1 distance in one vectorised step.
+
+    The row table (nndb row -> spdb row, -1 when the file is not in spdb)
+    is rebuilt only when either DB's path list changes, e.g. after update().
+    """
+
+    def __init__(self, nndb, spdb, candidates=100, k=10):
+        self.nndb = nndb
+        self.spdb = spdb
+        self.candidates = candidates
+        self.k = k
+        self.table = None
+        self.table_paths = (None, None)
+
+    def row_table(self):
+        if self.table_paths[0] is not self.nndb.paths or self.table_paths[1] is not self.spdb.paths:
+            self.table = self.spdb.rows(self.nndb.paths)
+            self.table_paths = (self.nndb.paths, self.spdb.paths)
+        return self.table
+
+    @torch.no_grad()
+    def search(self, x, k=None, candidates=None):
+        """
+        Returns:
+            paths (list): at most k spdb paths, best first
+            values (torch.Tensor): their stage-two L1 distances
+        """
+        k = k or self.k
+        candidates = candidates or self.candidates
+        cache, key = self.nndb.cache, None
+        if cache is not None and self.nndb.cache_results:
+            key = QueryCache.key(x, f'cascade-{self.spdb.method}-topk', k=k, candidates=candidates,
+                                 index=(index_version(self.nndb.weights), index_version(self.spdb.weight_path)))
+            result = cache.get(key)
+            if result is not None:
+                return result
+
+        # cache 에 없을 때만 decode, 두 stage 가 같은 signal 을 씀
+        signal = []
+
+        def decoded():
+            if not signal:
+                signal.append(librosa.load(x, sr=None))
+            return signal[0]
+
+        embedding = self.nndb.embed(x, decoded)
+        _, idxs = self.nndb.search(embedding, candidates)
+        rows = self.row_table()[idxs.cpu()]
+        rows = rows[rows >= 0]
+        if self.spdb.alive is not None:
+            rows = rows[self.spdb.alive[rows]]
+
+        query = self.spdb.query_vector(x, decoded).to(self.spdb.vecs.dtype)
+        dist = torch.sum(torch.abs(self.spdb.vecs[rows] - query), dim=1)
+        # stable sort 로 거리가 같으면 stage one 순서를 유지
+        value, order = torch.sort(dist, stable=True)
+        rows = rows[order[:k]]
+        result = [self.spdb.paths[row] for row in rows.tolist()], value[:k].cpu()
+        if key is not None:
+            cache.put(key, result)
+        return result
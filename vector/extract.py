@@ -0,0 +1,68 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import torch
+from tqdm import tqdm
+
+
+def _init_worker():
+    # worker 마다 torch thread 를 늘리면 core 수보다 thread 가 많아짐
+    torch.set_num_threads(1)
+
+
+def extract_one(func, path):
+    """Run one extractor call, returns (vector as numpy or None, failure reason, pid)"""
+    try:
+        vec = func(path)
+    except Exception as e:
+        return None, f'error: {e}', os.getpid()
+    if vec is False:
+        return None, 'extraction failed', os.getpid()
+    if vec.isnan().any():
+        return None, 'nan', os.getpid()
+    return vec.numpy(), None, os.getpid()
+
+
+def extract_features(func, paths, workers=1, chunksize=64):
+    """
+    Feature vectors of ``paths`` using ``func`` (path -> tensor or False).
+
+    With workers > 1 the paths are split into chunks of ``chunksize`` and sent
+    to a process pool. ``Executor.map`` yields results in input order, so the
+    output order does not depend on scheduling. Results go straight into one
+    preallocated tensor.
+
+    Returns:
+        vecs (torch.Tensor): n_ok x D, rows in path order
+        result_paths (list): paths of the rows of vecs
+        failures (dict): path -> (reason, worker pid)
+    """
+    work = partial(extract_one, func)
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker)
+        results = executor.map(work, paths, chunksize=chunksize)
+    else:
+        executor = None
+        results = map(work, paths)
+
+    out, ok, failures = None, torch.zeros(len(paths), dtype=torch.bool), {}
+    try:
+        for i, (vec, reason, pid) in enumerate(tqdm(results, total=len(paths))):
+            if vec is None:
+                failures[paths[i]] = (reason, pid)
+                continue
+            if out is None:
+                out = torch.empty((len(paths), vec.shape[0]), dtype=torch.from_numpy(vec).dtype)
+            out[i] = torch.from_numpy(vec)
+            ok[i] = True
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    print(f'entire : {len(paths)} , fail : {len(failures)}')
+    for reason, count in Counter(reason for reason, _ in failures.values()).most_common(5):
+        print(f'  {count} x {reason}')
+    if out is None:
+        return torch.empty((0, 0)), [], failures
+    return out[ok], [path for path, alive in zip(paths, ok.tolist()) if alive], failures
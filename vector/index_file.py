@@ -0,0 +1,173 @@
+"""
+Single-file index container (``index.bin``).
+
+Layout, every section aligned to ``ALIGN`` bytes::
+
+    [0:8]    magic  b'VECIDX\\0\\0'
+    [8:12]   format version (uint32, little endian)
+    [12:16]  header length (uint32)
+    [16:..]  header json: n, dim, dtype and {offset, nbytes, crc32} per section
+    vectors  n x dim   row-major, header dtype
+    stats    2 x dim   normalisation rows (VanlillaDB max/min), may be empty
+    offsets  n + 1     int64 byte offsets into strings
+    strings  utf-8 path / id table
+
+The vectors are opened with ``numpy.memmap`` (copy-on-write), so opening an
+index does not read it and every process serving the same file shares the
+OS page cache.
+"""
+import json, os, struct, zlib
+import numpy as np
+import torch
+
+MAGIC = b'VECIDX\0\0'
+VERSION = 1
+ALIGN = 4096
+SECTIONS = ('vectors', 'stats', 'offsets', 'strings')
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _numpy(x):
+    if isinstance(x, torch.Tensor):
+        return x.detach().cpu().numpy()
+    return np.asarray(x)
+
+
+class StringTable:
+    """Read-only list of strings backed by the offsets/strings sections"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+        self._lookup = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        return bytes(self.blob[self.offsets[i]:self.offsets[i+1]]).decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def index(self, value):
+        # list.index 와 같은 동작이지만 처음 한 번만 dict 를 만들고 이후 O(1)
+        if self._lookup is None:
+            self._lookup = {s: i for i, s in reversed(list(enumerate(self)))}
+        try:
+            return self._lookup[value]
+        except KeyError:
+            raise ValueError(f'{value} is not in table')
+
+
+class IndexFile:
+    def __init__(self, path, header, vecs, stats, paths):
+        self.path = path
+        self.header = header
+        self.vecs = vecs
+        self.stats = stats
+        self.paths = paths
+
+    def verify(self, chunk=1 << 24):
+        """Recompute the crc32 of every section, raises ValueError on mismatch"""
+        with open(self.path, 'rb') as f:
+            for name in SECTIONS:
+                section = self.header['sections'][name]
+                f.seek(section['offset'])
+                crc, left = 0, section['nbytes']
+                while left > 0:
+                    data = f.read(min(chunk, left))
+                    crc = zlib.crc32(data, crc)
+                    left -= len(data)
+                if crc != section['crc32']:
+                    raise ValueError(f'{self.path}: checksum mismatch in {name} section')
+        return True
+
+
+def write_index(path, vecs, paths, stats=None):
+    """
+    Write vectors, optional normalisation stats and the path table to ``path``.
+
+    The file is written next to the target and renamed into place, so
+    readers never see a half written index.
+    """
+    vecs = np.ascontiguousarray(_numpy(vecs))
+    n, dim = vecs.shape
+    assert n == len(paths), f'{n} vectors but {len(paths)} paths'
+    stats = np.ascontiguousarray(_numpy(stats).reshape(-1, dim).astype(vecs.dtype)) \
+        if stats is not None else np.zeros((0, dim), dtype=vecs.dtype)
+    encoded = [str(p).encode('utf-8') for p in paths]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    # uint8 view 로 그대로 crc/쓰기 (tobytes 복사 없음)
+    payloads = {
+        'vectors': vecs.reshape(-1).view(np.uint8),
+        'stats': stats.reshape(-1).view(np.uint8),
+        'offsets': offsets.view(np.uint8),
+        'strings': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+    }
+
+    header = {'n': n, 'dim': dim, 'dtype': vecs.dtype.name, 'stats_rows': stats.shape[0], 'sections': {}}
+    # header 길이가 section offset 에 영향을 주므로 한 블록을 header 용으로 예약
+    pos = ALIGN
+    for name in SECTIONS:
+        data = payloads[name]
+        header['sections'][name] = {'offset': pos, 'nbytes': data.nbytes, 'crc32': zlib.crc32(data)}
+        pos = _align(pos + data.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    assert 16 + len(header_bytes) <= ALIGN, 'index header too large'
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<II', VERSION, len(header_bytes)) + header_bytes)
+        for name in SECTIONS:
+            f.seek(header['sections'][name]['offset'])
+            f.write(payloads[name])
+        f.truncate(pos)
+    os.replace(tmp, path)
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        head = f.read(ALIGN)
+    if head[:8] != MAGIC:
+        raise ValueError(f'{path} is not an index file')
+    version, length = struct.unpack('<II', head[8:16])
+    if version > VERSION:
+        raise ValueError(f'{path}: unsupported index version {version}')
+    return json.loads(head[16:16 + length].decode('utf-8'))
+
+
+def open_index(path, verify=False):
+    """
+    Open ``index.bin`` without reading it.
+
+    ``vecs`` and ``stats`` are torch tensors over the memory map, ``paths`` is
+    a StringTable. verify=True checks every section's crc32 first, which
+    reads the whole file.
+    """
+    header = read_header(path)
+    sections = header['sections']
+    dtype = np.dtype(header['dtype'])
+    n, dim = header['n'], header['dim']
+
+    def section(name, dtype, shape):
+        if sections[name]['nbytes'] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='c', offset=sections[name]['offset'], shape=shape)
+
+    vecs = torch.from_numpy(section('vectors', dtype, (n, dim)))
+    stats = torch.from_numpy(section('stats', dtype, (header['stats_rows'], dim)))
+    offsets = section('offsets', np.int64, (n + 1,))
+    strings = section('strings', np.uint8, (sections['strings']['nbytes'],))
+    index = IndexFile(path, header, vecs, stats, StringTable(offsets, strings))
+    if verify:
+        index.verify()
+    return index
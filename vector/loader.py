@@ -0,0 +1,147 @@
+from functools import partial
+import librosa
+import numpy as np
+import soundfile as sf
+import torch
+from torch.utils.data import Dataset, DataLoader
+
+# clip 은 이 길이 중 가장 가까운 (긴) 것까지 뒤를 0 으로 채움, index 와 query 가 같은 규칙
+BUCKET_SECONDS = (1, 2, 3, 5, 10)
+
+
+class AudioClips(Dataset):
+    """
+    Decodes and resamples one clip per item, inside DataLoader workers.
+
+    Items are (position, waveform) and the waveform is None when the file
+    could not be decoded, so one broken file does not kill the batch.
+    Clips cached in ``arena`` (PCMArena) are sliced from it instead.
+    """
+
+    def __init__(self, paths, sr=32000, max_seconds=None, arena=None):
+        self.paths = paths
+        self.sr = sr
+        self.max_seconds = max_seconds
+        self.arena = arena
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, i):
+        try:
+            if self.arena is not None:
+                y, _ = self.arena.load(self.paths[i], sr=self.sr, max_seconds=self.max_seconds)
+            else:
+                y, _ = librosa.load(self.paths[i], sr=self.sr, duration=self.max_seconds)
+        except Exception:
+            return i, None
+        if len(y) == 0:
+            return i, None
+        return i, torch.from_numpy(y)
+
+
+def clip_samples(paths, sr=32000, max_seconds=None, arena=None):
+    """
+    Sample count of every clip once cropped to max_seconds and resampled
+    to sr, from the file headers (the arena table when cached, 0 when
+    unreadable), computed like librosa.load / librosa.resample.
+    """
+    lengths = []
+    for path in paths:
+        row = arena.rows.get(arena.key(path)) if arena is not None else None
+        try:
+            if row is not None:
+                frames, native_sr = int(arena.lengths[row]), int(arena.srs[row])
+            else:
+                info = sf.info(path)
+                frames, native_sr = info.frames, info.samplerate
+        except Exception:
+            lengths.append(0)
+            continue
+        if max_seconds is not None:
+            frames = min(frames, int(max_seconds * native_sr))
+        lengths.append(frames if native_sr == sr else int(np.ceil(frames * sr / native_sr)))
+    return lengths
+
+
+def bucket_length(n, sr=32000):
+    """smallest BUCKET_SECONDS length (in samples at sr) holding n samples, n when it is longer than all of them"""
+    for seconds in BUCKET_SECONDS:
+        if n <= seconds * sr:
+            return int(seconds * sr)
+    return n
+
+
+def fit_clip(y, length):
+    """y zero-padded at the end to length samples"""
+    if len(y) >= length:
+        return y[:length]
+    return torch.cat((y, y.new_zeros(length - len(y))))
+
+
+def length_buckets(lengths, batch_size, sr=32000):
+    """
+    Batches of dataset positions whose clips pad to the same bucket length
+    (see bucket_length), so one-shots of arbitrary length still fill a batch.
+    """
+    groups = {}
+    for i, n in enumerate(lengths):
+        groups.setdefault(bucket_length(n, sr), []).append(i)
+    return [group[i:i+batch_size] for _, group in sorted(groups.items()) for i in range(0, len(group), batch_size)]
+
+
+def collate_clips(items, sr=32000):
+    """
+    Pad the decoded clips of a batch to their bucket length and stack them.
+
+    Returns (groups, failed) where every group is (positions, B x L batch).
+    A clip pads to the same length whatever else is in its batch, so its
+    embedding equals passt_embed of the clip alone; a clip whose header
+    lied about its length lands in its own group.
+    """
+    failed = [i for i, y in items if y is None]
+    by_length = {}
+    for i, y in items:
+        if y is not None:
+            n = bucket_length(len(y), sr)
+            by_length.setdefault(n, []).append((i, fit_clip(y, n)))
+    groups = [([i for i, _ in clips], torch.stack([y for _, y in clips])) for clips in by_length.values()]
+    return groups, failed
+
+
+def clip_loader(paths, sr=32000, batch_size=16, num_workers=4, max_seconds=None, pin_memory=False, arena=None):
+    """
+    DataLoader yielding (groups, failed) over length-bucketed clips (see collate_clips).
+
+    Decoding/resampling runs in ``num_workers`` processes and up to two
+    batches per worker are prefetched while the model runs.
+    """
+    buckets = length_buckets(clip_samples(paths, sr, max_seconds, arena), batch_size, sr)
+    kwargs = {'prefetch_factor': 2} if num_workers > 0 else {}
+    return DataLoader(AudioClips(paths, sr, max_seconds, arena), batch_sampler=buckets,
+                      collate_fn=partial(collate_clips, sr=sr), num_workers=num_workers,
+                      pin_memory=pin_memory, **kwargs)
+
+
+@torch.no_grad()
+def passt_embed(model, clips, device, counts=None):
+    """
+    PaSST embeddings of decoded 32kHz clips.
+
+    Every clip is zero-padded to its bucket length (bucket_length), like the
+    index clips in collate_clips, and clips of the same bucket share one
+    forward pass. ``counts`` (dict), when given, accumulates 'forwards' and
+    'clips' of the forward passes actually run.
+    """
+    groups = {}
+    for i, clip in enumerate(clips):
+        groups.setdefault(bucket_length(len(clip)), []).append(i)
+    out = [None] * len(clips)
+    for n, positions in groups.items():
+        batch = torch.stack([fit_clip(clips[i], n) for i in positions]).to(device)
+        for i, embedding in zip(positions, model(batch)):
+            out[i] = embedding
+        if counts is not None:
+            counts['forwards'] = counts.get('forwards', 0) + 1
+            counts['clips'] = counts.get('clips', 0) + len(positions)
+    return out
@@ -0,0 +1,120 @@
+import hashlib, json, os
+import torch
+from .shard import list_audio
+
+
+def content_hash(path, chunk=1 << 20):
+    """blake2b digest of the file bytes"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def bytes_hash(data):
+    """content_hash of a file holding ``data``"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_entry(path, row, digest=None):
+    st = os.stat(path)
+    return {'row': row, 'size': st.st_size, 'mtime': st.st_mtime_ns,
+            'hash': digest if digest is not None else content_hash(path)}
+
+
+class Manifest:
+    """
+    Per-index record of which file each row was extracted from.
+
+    ``files`` maps path -> {row, size, mtime, hash}. ``deleted`` holds the
+    rows of files that disappeared (tombstones). They stay in the index, so
+    row ids used by ann.pt / pq.pt remain valid, and are masked out of the
+    search until the next compaction.
+    """
+
+    def __init__(self, files=None, deleted=None):
+        self.files = files or {}
+        self.deleted = set(deleted or [])
+
+    @classmethod
+    def load(cls, weights):
+        path = f'{weights}/manifest.json'
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['files'], data['deleted'])
+
+    @classmethod
+    def from_paths(cls, paths, digests=None):
+        """Manifest for an index built from ``paths`` (row i == paths[i]), reusing known hashes"""
+        digests = digests or {}
+        files = {}
+        for row, path in enumerate(paths):
+            if os.path.exists(path):
+                files[path] = file_entry(path, row, digests.get(path))
+        return cls(files)
+
+    def save(self, weights):
+        tmp = f'{weights}/manifest.json.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files, 'deleted': sorted(self.deleted)}, f)
+        os.replace(tmp, f'{weights}/manifest.json')
+
+    def diff(self, audio_dir, shard=None):
+        """
+        Compare the manifest with the wav files in ``audio_dir`` (those of ``shard`` only, when given).
+
+        Size/mtime are checked first and the content hash only for files
+        whose stat changed, so an untouched library costs one stat per file.
+
+        Returns:
+            added (list): paths not in the manifest
+            changed (list): paths whose content hash changed
+            deleted (list): manifest paths that no longer exist
+        """
+        on_disk = list_audio(audio_dir, shard)
+        seen = set(on_disk)
+        added, changed = [], []
+        for path in on_disk:
+            entry = self.files.get(path)
+            if entry is None:
+                added.append(path)
+                continue
+            st = os.stat(path)
+            if st.st_size == entry['size'] and st.st_mtime_ns == entry['mtime']:
+                continue
+            digest = content_hash(path)
+            if digest != entry['hash']:
+                changed.append(path)
+            else:
+                # touch 만 된 파일
+                entry['size'], entry['mtime'] = st.st_size, st.st_mtime_ns
+        deleted = [path for path in self.files if path not in seen]
+        return added, changed, deleted
+
+    def tombstone(self, paths):
+        for path in paths:
+            self.deleted.add(self.files.pop(path)['row'])
+
+    def compact(self, n_rows):
+        """Drop tombstoned rows, renumber the survivors and return the keep mask"""
+        keep = [row not in self.deleted for row in range(n_rows)]
+        new_row, remap = 0, {}
+        for row, alive in enumerate(keep):
+            if alive:
+                remap[row] = new_row
+                new_row += 1
+        for entry in self.files.values():
+            entry['row'] = remap[entry['row']]
+        self.deleted = set()
+        return keep
+
+    def alive_mask(self, n_rows):
+        """bool tensor, False for tombstoned rows (None when nothing is deleted)"""
+        if not self.deleted:
+            return None
+        alive = torch.ones(n_rows, dtype=torch.bool)
+        alive[sorted(self.deleted)] = False
+        return alive
@@ -0,0 +1,68 @@
+import json, os, sqlite3
+from tqdm import tqdm
+
+
+class MetaStore:
+    """
+    SQLite copy of the samples_meta json files.
+
+    Every sample is one row keyed by uuid (the wav file stem in our
+    libraries) with a second index on the stem of its original name, so a
+    batch of result ids is answered with a couple of indexed queries
+    instead of a walk over every json file.
+    """
+
+    def __init__(self, path, batch=512):
+        self.path = path
+        self.batch = batch
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS samples ('
+                          'uuid TEXT PRIMARY KEY, stem TEXT, collection_id INTEGER, data TEXT)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS samples_stem ON samples (stem)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM samples').fetchone()[0]
+
+    @property
+    def built(self):
+        """True once a build has committed (an interrupted build leaves no marker)"""
+        return self.conn.execute("SELECT 1 FROM info WHERE key = 'built'").fetchone() is not None
+
+    def build(self, meta_paths):
+        """Bulk load (or refresh) the samples of the given json files"""
+        count = 0
+        with self.conn:
+            for path in tqdm(meta_paths, desc='loading json files'):
+                with open(path, 'r', encoding='utf-8') as f:
+                    samples = json.load(f)['samples']
+                rows = [(s['uuid'], os.path.splitext(os.path.basename(s.get('name') or ''))[0],
+                         s.get('collection_id', s.get('product_id')), json.dumps(s)) for s in samples]
+                self.conn.executemany('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)', rows)
+                count += len(rows)
+            # rows 와 같은 transaction 에서 commit 되므로 중간에 끊기면 marker 도 없음
+            self.conn.execute("INSERT OR REPLACE INTO info VALUES ('built', ?)", (str(count),))
+        return count
+
+    def query(self, column, ids):
+        found = {}
+        ids = list(dict.fromkeys(ids))
+        for i in range(0, len(ids), self.batch):
+            chunk = ids[i:i+self.batch]
+            rows = self.conn.execute(f'SELECT {column}, data FROM samples '
+                                     f'WHERE {column} IN ({",".join("?" * len(chunk))})', chunk)
+            for key, data in rows:
+                found.setdefault(key, json.loads(data))
+        return found
+
+    def lookup(self, ids):
+        """id -> sample for the ids found, an id may be a uuid or a name stem"""
+        found = self.query('uuid', ids)
+        missing = [i for i in ids if i not in found]
+        if missing:
+            found.update(self.query('stem', missing))
+        return found
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,294 @@
+"""
+Decode-once ingestion pipeline.
+
+A sample used to be decoded three times: by cvtmp3.py (mp3 -> wav), by
+filter_samples.py (validation, at 22.05kHz) and by initialize.py (once
+per method, at the native rate for fft/mfcc and 32kHz for PaSST). Here
+every file is read and decoded once, then flows through
+
+    read -> decode -> validate -> encode -> resample -> extract -> embed -> store
+
+with a bounded queue between stages, so a slow stage (usually the model)
+holds the readers back instead of letting decoded audio pile up in
+memory. Each stage runs in its own threads (libsndfile decoding, soxr
+resampling, scipy/torch FFTs and the model all release the GIL).
+
+Features are written to the FeatureStore under the content hash of the
+wav that lands in ``out_dir`` (of the source itself when nothing is
+written), so initialize.py --feature_store=... builds the indexes
+afterwards from store hits only.
+"""
+import io, os, queue, threading, time
+import numpy as np
+import soundfile as sf
+import librosa
+import torch
+from tqdm import tqdm
+from .manifest import bytes_hash
+
+# 각 extractor 가 받는 sample rate (None: 원래 rate)
+RATES = {'fft': None, 'mfcc': None, 'attack': 22050, 'passot': 32000}
+
+DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline run by ``workers`` threads.
+
+    ``fn(item) -> item``, or ``fn(items) -> items`` for up to ``batch`` items
+    at a time when batch > 1 (items left out of the returned list are
+    dropped). An exception marks the item (the whole batch) as failed.
+    """
+
+    def __init__(self, name, fn, workers=1, batch=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch = batch
+
+
+class Pipeline:
+    """
+    Linear stage graph connected by bounded queues (``maxsize`` items each).
+
+    Items are dicts with a 'path'. Failures are recorded per path as
+    (stage name, reason); the outputs of the last stage are returned.
+    """
+
+    def __init__(self, stages, maxsize=32):
+        self.stages = stages
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.failed = {}
+        self.outputs = []
+        self.busy = {stage.name: 0.0 for stage in stages}
+
+    def fail(self, stage, items, error):
+        with self.lock:
+            for item in items:
+                self.failed[item['path']] = (stage.name, str(error) or type(error).__name__)
+
+    def work(self, stage, inbox, outbox, pbar):
+        finished = False
+        while not finished:
+            items = []
+            while len(items) < stage.batch:
+                item = inbox.get()
+                if item is DONE:
+                    finished = True
+                    break
+                items.append(item)
+            if not items:
+                continue
+            start = time.time()
+            try:
+                out = stage.fn(items) if stage.batch > 1 else [stage.fn(items[0])]
+            except Exception as e:
+                self.fail(stage, items, e)
+                out = []
+            with self.lock:
+                self.busy[stage.name] += time.time() - start
+            out = [item for item in out if item is not None]
+            if outbox is not None:
+                for item in out:
+                    outbox.put(item)
+            else:
+                with self.lock:
+                    self.outputs += out
+                pbar.update(len(out))
+
+    def run(self, items, total=None):
+        """
+        Push ``items`` through every stage.
+
+        Returns:
+            dict: outputs (items out of the last stage), failed (path -> (stage, reason)),
+            seconds, busy seconds per stage
+        """
+        inboxes = [queue.Queue(self.maxsize) for _ in self.stages]
+        start = time.time()
+        with tqdm(total=total, desc='ingesting') as pbar:
+            threads = []
+            for i, stage in enumerate(self.stages):
+                outbox = inboxes[i + 1] if i + 1 < len(self.stages) else None
+                threads.append([threading.Thread(target=self.work, args=(stage, inboxes[i], outbox, pbar), daemon=True)
+                                for _ in range(stage.workers)])
+                for thread in threads[-1]:
+                    thread.start()
+            for item in items:
+                # queue 가 차면 여기서 멈춤 (backpressure)
+                inboxes[0].put(item)
+            # 앞 stage 가 모두 끝난 뒤에 다음 stage 를 닫음
+            for stage, inbox, workers in zip(self.stages, inboxes, threads):
+                for _ in workers:
+                    inbox.put(DONE)
+                for thread in workers:
+                    thread.join()
+        return {'outputs': list(self.outputs), 'failed': dict(self.failed), 'seconds': time.time() - start,
+                'busy': dict(self.busy)}
+
+
+def read(item):
+    with open(item['path'], 'rb') as f:
+        item['data'] = f.read()
+    return item
+
+
+def decode(item):
+    """mono float32 signal at the native rate, like librosa.load(path, sr=None)"""
+    try:
+        y, sr = sf.read(io.BytesIO(item['data']), dtype='float32', always_2d=True)
+        y = y.mean(axis=1) if y.shape[1] > 1 else y[:, 0]
+    except Exception:
+        # libsndfile 가 못 읽는 파일은 audioread 로
+        y, sr = librosa.load(item['path'], sr=None)
+    item['y'], item['sr'] = y, sr
+    return item
+
+
+def check_signal(y, sr, min_duration=0.5, min_rms=0.01):
+    """raise ValueError unless the signal is long enough and has a frame above min_rms"""
+    if len(y) < min_duration * sr:
+        raise ValueError('too short')
+    if np.max(librosa.feature.rms(y=y)[0]) < min_rms:
+        raise ValueError('no sound')
+
+
+def encode(item, out_dir):
+    """
+    Bytes of the wav written to out_dir: the source bytes for a wav source,
+    otherwise a PCM16 wav of the decoded signal (what cvtmp3.py wrote). The
+    signal is decoded back from those bytes, so features match what a later
+    librosa.load of the written file gives.
+    """
+    name = os.path.splitext(os.path.basename(item['path']))[0]
+    item['out'] = os.path.join(out_dir, f'{name}.wav')
+    if not item['path'].lower().endswith('.wav'):
+        buffer = io.BytesIO()
+        sf.write(buffer, item['y'], item['sr'], format='WAV')
+        item['data'] = buffer.getvalue()
+        item['y'] = sf.read(io.BytesIO(item['data']), dtype='float32')[0]
+    return item
+
+
+def resample(item, methods, max_seconds=10):
+    """signals[rate] for every rate the extractors need, each computed once, and the 32kHz PaSST clip"""
+    y, sr = item['y'], item['sr']
+    signals = {}
+    for method in methods:
+        rate = RATES[method] or sr
+        if method != 'passot' and rate not in signals:
+            signals[rate] = y if rate == sr else librosa.resample(y, orig_sr=sr, target_sr=rate)
+    if 'passot' in methods:
+        # PaSST 는 앞 max_seconds 만 사용 (clip_loader 와 같은 crop)
+        clip = y[:int(max_seconds * sr)]
+        item['clip'] = clip if sr == 32000 else librosa.resample(clip, orig_sr=sr, target_sr=32000)
+    item['signals'] = signals
+    return item
+
+
+def extract(item, extractors):
+    """features[method] of every signal extractor, a failed method does not drop the item"""
+    features = item.setdefault('features', {})
+    for method, fn in extractors.items():
+        rate = RATES[method] or item['sr']
+        try:
+            vec = fn(item['signals'][rate], rate)
+        except Exception as e:
+            item.setdefault('errors', {})[method] = f'error: {e}'
+            continue
+        if vec is False or vec.isnan().any():
+            item.setdefault('errors', {})[method] = 'extraction failed' if vec is False else 'nan'
+            continue
+        features[method] = vec
+    return item
+
+
+def embed(items, model, device, key):
+    """PaSST embeddings of a batch (loader.passt_embed), clip by clip if the batch fails"""
+    from .loader import passt_embed
+    ready = [item for item in items if len(item['clip'])]
+    clips = [torch.from_numpy(item['clip']) for item in ready]
+    try:
+        embeddings = passt_embed(model, clips, device)
+    except Exception:
+        embeddings = []
+        for clip in clips:
+            try:
+                embeddings.append(passt_embed(model, [clip], device)[0])
+            except Exception:
+                embeddings.append(None)
+    for item, embedding in zip(ready, embeddings):
+        if embedding is None:
+            item.setdefault('errors', {})['passot'] = 'embedding failed'
+        else:
+            item.setdefault('features', {})[key] = embedding
+    return items
+
+
+def store_features(items, store):
+    """write the wavs (tmp + os.replace) and put their features in the store, a batch per transaction"""
+    rows = {}
+    for item in items:
+        if item.get('out') is not None:
+            tmp = f"{item['out']}.part"
+            with open(tmp, 'wb') as f:
+                f.write(item['data'])
+            os.replace(tmp, item['out'])
+        digest = bytes_hash(item['data'])
+        for extractor, vec in item.get('features', {}).items():
+            rows.setdefault(extractor, []).append((digest, vec))
+        # 결과 item 에는 path / out / errors 만 남김
+        for name in ('data', 'y', 'signals', 'clip', 'features'):
+            item.pop(name, None)
+    if store is not None:
+        for extractor, pairs in rows.items():
+            store.put_many(extractor, pairs)
+    return items
+
+
+def ingest_stages(methods, store=None, out_dir=None, model=None, device='cpu', max_seconds=10,
+                  min_duration=0.5, min_rms=0.01, delete_source=False, workers=None, batch_size=16):
+    """
+    Stages of the ingestion pipeline for ``methods`` (fft / mfcc / attack / passot).
+
+    Args:
+        store (FeatureStore): where features go, keyed like initialize.py
+        out_dir (str): write valid samples here as wav (None: keep sources in place)
+        model: PaSST model (get_basic_model(mode='embed_only')), needed for passot
+        delete_source (bool): remove a converted source file once its wav is written
+        workers (dict): stage name -> thread count
+        batch_size (int): PaSST batch / store transaction size
+    """
+    from . import SIGNAL_EXTRACTORS
+    workers = {'read': 2, 'decode': 4, 'validate': 2, 'encode': 2, 'resample': 2, 'extract': 4, 'embed': 1, 'store': 1,
+               **(workers or {})}
+    extractors = {m: SIGNAL_EXTRACTORS[m] for m in methods if m != 'passot'}
+
+    def validate(item):
+        check_signal(item['y'], item['sr'], min_duration, min_rms)
+        return item
+
+    def finish(items):
+        items = store_features(items, store)
+        if delete_source:
+            for item in items:
+                if item.get('out') is not None and os.path.abspath(item['out']) != os.path.abspath(item['path']):
+                    os.remove(item['path'])
+        return items
+
+    stages = [Stage('read', read, workers['read']),
+              Stage('decode', decode, workers['decode']),
+              Stage('validate', validate, workers['validate'])]
+    if out_dir is not None:
+        stages.append(Stage('encode', lambda item: encode(item, out_dir), workers['encode']))
+    if methods:
+        stages.append(Stage('resample', lambda item: resample(item, methods, max_seconds), workers['resample']))
+    if extractors:
+        stages.append(Stage('extract', lambda item: extract(item, extractors), workers['extract']))
+    if 'passot' in methods:
+        stages.append(Stage('embed', lambda items: embed(items, model, device, f'passot:{max_seconds}'),
+                            workers['embed'], batch_size))
+    stages.append(Stage('store', finish, workers['store'], batch_size))
+    return stages
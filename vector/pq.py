@@ -0,0 +1,72 @@
+import torch
+from .ann import kmeans, assign_clusters
+from .utils import chunked_topk
+
+
+class PQCodec:
+    """
+    Product quantiser for the PaSST embeddings.
+
+    The D dimensions are split into ``m`` contiguous sub-spaces (sizes may
+    differ by one when m does not divide D) and every sub-space gets its own
+    k-means codebook of ``2**nbits`` codewords, so a row is stored as ``m``
+    uint8 codes instead of ``D`` float32 values. L1 distance is a sum over
+    dimensions, so a query is scored with one m x 2**nbits distance table
+    (asymmetric distance computation) and a gather + sum over the codes.
+    """
+
+    def __init__(self, codebooks, bounds):
+        self.codebooks = codebooks
+        self.bounds = bounds
+
+    @classmethod
+    def train(cls, vecs, m=128, nbits=8, n_iter=20, max_train=65536):
+        assert nbits <= 8, 'codes are stored as uint8'
+        print(f'training pq codebooks (m={m}, nbits={nbits})')
+        dims = torch.arange(vecs.shape[1]).tensor_split(m)
+        bounds = [(int(d[0]), int(d[-1]) + 1) for d in dims]
+        codebooks = [kmeans(vecs[:, s:e], 2 ** nbits, n_iter=n_iter, max_train=max_train)
+                     for s, e in bounds]
+        return cls(codebooks, bounds)
+
+    @property
+    def m(self):
+        return len(self.bounds)
+
+    def encode(self, vecs):
+        codes = torch.empty((vecs.shape[0], self.m), dtype=torch.uint8, device=vecs.device)
+        for j, (s, e) in enumerate(self.bounds):
+            codes[:, j] = assign_clusters(vecs[:, s:e], self.codebooks[j]).to(torch.uint8)
+        return codes
+
+    def decode(self, codes):
+        codes = codes.long()
+        return torch.cat([self.codebooks[j][codes[:, j]] for j in range(self.m)], dim=1)
+
+    def distance_table(self, x):
+        """m x 2**nbits table of L1 distances from x's sub-vectors to every codeword"""
+        x = x.reshape(-1).float()
+        ksub = max(c.shape[0] for c in self.codebooks)
+        table = torch.full((self.m, ksub), float('inf'), device=x.device)
+        for j, (s, e) in enumerate(self.bounds):
+            cb = self.codebooks[j]
+            table[j, :cb.shape[0]] = torch.sum(torch.abs(cb - x[s:e]), dim=1)
+        return table
+
+    @staticmethod
+    def distances(table, codes):
+        return table.gather(1, codes.long().T).sum(dim=0)
+
+    def search(self, codes, x, k=10, chunk_size=16384, valid=None):
+        table = self.distance_table(x)
+        return chunked_topk(lambda start, end: self.distances(table, codes[start:end]),
+                            codes.shape[0], k, chunk_size, valid)
+
+    def save(self, path, codes):
+        torch.save({'codebooks': self.codebooks, 'bounds': self.bounds, 'codes': codes}, path)
+
+    @classmethod
+    def load(cls, path, map_location=None):
+        """Returns (codec, codes)"""
+        state = torch.load(path, map_location=map_location)
+        return cls(state['codebooks'], state['bounds']), state['codes']
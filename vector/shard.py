@@ -0,0 +1,200 @@
+"""
+Sharded indexes.
+
+A library is split into ``count`` shards by a stable hash of the file name
+(or of its collection), every shard is an ordinary NNDB / VanlillaDB
+weights dir (``{weights}_shard{i}``) built by initialize.py, and
+``ShardedSearch`` fans a query out to the shards and merges their top-k.
+Each shard returns its own exact top-k, so the merged top-k is exact too.
+"""
+import hashlib, json, os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from glob import glob
+from multiprocessing import get_context
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+import torch
+
+
+def stable_hash(key):
+    # python hash() 는 process 마다 달라지므로 blake2b 사용
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def collections_from_meta(meta_paths):
+    """file stem (sample uuid) -> product_id, from samples_meta json files"""
+    collections = {}
+    for path in meta_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        for sample in meta['samples']:
+            collections[sample['uuid']] = str(sample.get('product_id'))
+    return collections
+
+
+class ShardSpec:
+    """
+    Which files belong to shard ``index`` of ``count``.
+
+    by='hash' hashes the file name, by='collection' hashes
+    ``collections[stem]`` (files without a collection fall back to their
+    name), so a whole collection lands in one shard.
+    """
+
+    def __init__(self, index, count, by='hash', collections=None):
+        assert 0 <= index < count, f'shard {index} out of {count}'
+        self.index = index
+        self.count = count
+        self.by = by
+        self.collections = collections or {}
+
+    def key(self, path):
+        name = os.path.basename(path)
+        if self.by == 'collection':
+            return self.collections.get(os.path.splitext(name)[0], name)
+        return name
+
+    def owns(self, path):
+        return stable_hash(self.key(path)) % self.count == self.index
+
+
+def list_audio(audio_dir, shard=None):
+    """
+    Sorted wav / flac files of audio_dir, only those of ``shard`` when given.
+    A stem present in both formats is listed once, as its wav.
+    """
+    wavs = glob(f'{audio_dir}/*.wav')
+    stems = {os.path.splitext(path)[0] for path in wavs}
+    paths = sorted(wavs + [path for path in glob(f'{audio_dir}/*.flac') if os.path.splitext(path)[0] not in stems])
+    if shard is None:
+        return paths
+    return [path for path in paths if shard.owns(path)]
+
+
+def shard_weights(weights, index):
+    return f'{weights}_shard{index}'
+
+
+def align_stats(weights_dirs):
+    """
+    Re-normalise VanlillaDB shards to one global min/max.
+
+    Every shard is min/max normalised over its own rows, so L1 distances of
+    different shards are not comparable until they share the same stats.
+    Shards built one at a time (initialize.py --shard i, e.g. on separate
+    hosts) must be aligned with initialize.py --align_only once all of them
+    exist. Aligning again is harmless.
+    """
+    from .utils import load_weight, save_weight
+    shards = [load_weight(w) for w in weights_dirs]
+    max_val = torch.stack([mx for _, _, mx, _ in shards]).max(dim=0).values
+    min_val = torch.stack([mn for _, _, _, mn in shards]).min(dim=0).values
+    for weights, (paths, vecs, mx, mn) in zip(weights_dirs, shards):
+        # row 가 하나뿐인 shard 는 mx == mn 이라 normalised 값이 nan, 원래 값은 mn
+        raw = torch.where(mx > mn, vecs * (mx - mn) + mn, mn)
+        save_weight(weights, list(paths), (raw - min_val) / (max_val - min_val), max_val, min_val)
+    return max_val, min_val
+
+
+_db = None
+
+
+def _load_shard(kind, audio_dir, weights, kwargs):
+    global _db
+    from . import NNDB, VanlillaDB
+    # weights 가 없으면 NNDB / VanlillaDB 가 audio_dir 전체로 새 index 를 만들어 버림
+    if not any(os.path.exists(f'{weights}/{name}') for name in ('index.bin', 'weight.pt', 'tensor.pt')):
+        raise FileNotFoundError(f'shard {weights} is not built')
+    if kind == 'passot':
+        _db = NNDB(audio_dir, weights=weights, **kwargs)
+    else:
+        _db = VanlillaDB(audio_dir, weights=weights, method=kind, **kwargs)
+
+
+def _shard_search(x, k):
+    paths, values = _db.get_k_sims(x, k)
+    return list(paths), [float(v) for v in values]
+
+
+class ProcessShard:
+    """One shard loaded in its own worker process"""
+
+    def __init__(self, kind, audio_dir, weights, **kwargs):
+        self.name = weights
+        self.executor = ProcessPoolExecutor(1, mp_context=get_context('spawn'), initializer=_load_shard,
+                                            initargs=(kind, audio_dir, weights, kwargs))
+
+    def submit(self, x, k):
+        try:
+            return self.executor.submit(_shard_search, x, k)
+        except BrokenProcessPool as e:
+            # shard 를 못 읽은 worker (initializer 실패), 결과에서 missing 으로
+            future = Future()
+            future.set_exception(e)
+            return future
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+class HTTPShard:
+    """
+    A shard served by server.py on another host (or port). The query audio
+    is uploaded, so it only has to exist where the search starts.
+    """
+
+    def __init__(self, url, method='passot', timeout=30):
+        self.name = url
+        self.url = url.rstrip('/')
+        self.method = method
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(4)
+
+    def request(self, x, k):
+        with open(x, 'rb') as f:
+            body = f.read()
+        query = urlencode({'method': self.method, 'k': k, 'suffix': os.path.splitext(x)[1] or '.wav'})
+        req = Request(f'{self.url}/search?{query}', data=body, headers={'Content-Type': 'application/octet-stream'})
+        with urlopen(req, timeout=self.timeout) as res:
+            result = json.load(res)
+        return result['paths'], result['distances']
+
+    def submit(self, x, k):
+        return self.executor.submit(self.request, x, k)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+class ShardedSearch:
+    """
+    Scatter a query to every shard and merge the per-shard top-k.
+
+    Shards that fail or do not answer within ``timeout`` seconds are left
+    out; the result is then flagged ``partial`` and lists them in
+    ``missing``.
+    """
+
+    def __init__(self, shards, timeout=10):
+        self.shards = shards
+        self.timeout = timeout
+
+    def get_k_sims(self, x, k=10, timeout=None):
+        futures = {shard.submit(x, k): shard for shard in self.shards}
+        done, _ = wait(futures, timeout=timeout or self.timeout)
+        candidates, missing = [], []
+        for future, shard in futures.items():
+            if future not in done or future.exception() is not None:
+                future.cancel()
+                missing.append(shard.name)
+                continue
+            paths, values = future.result()
+            candidates += zip(values, paths)
+        candidates.sort(key=lambda c: c[0])
+        return {'paths': [p for _, p in candidates[:k]], 'values': [v for v, _ in candidates[:k]],
+                'partial': bool(missing), 'missing': missing}
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
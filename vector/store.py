@@ -0,0 +1,111 @@
+import os, sqlite3
+from threading import Lock
+import numpy as np
+import torch
+from .manifest import content_hash
+
+# extractor 출력이 바뀌면 version 을 올려서 예전 row 를 무시
+VERSIONS = {
+    'fft': 4,       # fft_descriptors_batch, exact length (same values as the per-file version)
+    'mfcc': 1,      # compute_enhanced_descriptors
+    'attack': 1,    # compute_attack_descriptors
+    'passot': 3,    # PaSST embed_only, zero-padded to fixed bucket lengths
+}
+
+
+class FeatureStore:
+    """
+    SQLite store of feature vectors shared by every DB build.
+
+    Rows are keyed by (content hash, extractor, version), so a file that was
+    renamed, copied into another library or indexed into a different weights
+    dir is never extracted twice, while an edited file or a bumped extractor
+    version misses. The extractor name may carry parameters after a colon
+    (``passot:10``), the version comes from ``VERSIONS`` of the part before it.
+
+    Content hashes are memoised per (path, size, mtime), so building several
+    methods from the same directory with one store hashes each file once.
+    """
+
+    def __init__(self, path, batch=512):
+        self.path = path
+        self.batch = batch
+        self.lock = Lock()
+        self.hashes = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS features ('
+                          'hash TEXT, extractor TEXT, version INTEGER, dtype TEXT, data BLOB, '
+                          'PRIMARY KEY (hash, extractor, version))')
+        self.conn.commit()
+
+    @staticmethod
+    def version(extractor):
+        return VERSIONS.get(extractor.split(':')[0], 0)
+
+    def content_hash(self, path):
+        st = os.stat(path)
+        key = (path, st.st_size, st.st_mtime_ns)
+        if key not in self.hashes:
+            self.hashes[key] = content_hash(path)
+        return self.hashes[key]
+
+    def digests(self, paths):
+        """path -> content hash for the paths this store has hashed"""
+        return {path: self.content_hash(path) for path in paths}
+
+    def get_many(self, extractor, hashes):
+        """hash -> numpy vector for the hashes present in the store"""
+        version = self.version(extractor)
+        found = {}
+        hashes = list(dict.fromkeys(hashes))
+        with self.lock:
+            for i in range(0, len(hashes), self.batch):
+                chunk = hashes[i:i+self.batch]
+                rows = self.conn.execute(
+                    f'SELECT hash, dtype, data FROM features WHERE extractor = ? AND version = ? '
+                    f'AND hash IN ({",".join("?" * len(chunk))})', [extractor, version, *chunk])
+                for digest, dtype, data in rows:
+                    found[digest] = np.frombuffer(data, dtype=dtype)
+        return found
+
+    def put_many(self, extractor, items):
+        """Store (hash, vector) pairs, vectors may be tensors or numpy arrays"""
+        version = self.version(extractor)
+        rows = []
+        for digest, vec in items:
+            if isinstance(vec, torch.Tensor):
+                vec = vec.detach().cpu().numpy()
+            vec = np.ascontiguousarray(vec)
+            rows.append((digest, extractor, version, vec.dtype.name, vec.tobytes()))
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?)', rows)
+            self.conn.commit()
+
+    def extract(self, extractor, paths, run):
+        """
+        Vectors of ``paths``, running ``run(missing_paths) -> (vecs, result_paths)``
+        only on the files not in the store yet.
+
+        Returns:
+            vecs (torch.Tensor): n_ok x D, rows in path order
+            result_paths (list): paths of the rows of vecs
+        """
+        digests = [self.content_hash(path) for path in paths]
+        found = self.get_many(extractor, digests)
+        missing = [path for path, digest in zip(paths, digests) if digest not in found]
+        print(f'feature store [{extractor}] hit : {len(paths) - len(missing)} , miss : {len(missing)}')
+        if missing:
+            vecs, result_paths = run(missing)
+            new = [(self.content_hash(path), vec) for path, vec in zip(result_paths, vecs)]
+            self.put_many(extractor, new)
+            for digest, vec in new:
+                found[digest] = vec.detach().cpu().numpy() if isinstance(vec, torch.Tensor) else vec
+        result_paths = [path for path, digest in zip(paths, digests) if digest in found]
+        if not result_paths:
+            return torch.empty((0, 0)), []
+        vecs = np.stack([found[digest] for digest in digests if digest in found])
+        return torch.from_numpy(vecs), result_paths
+
+    def close(self):
+        self.conn.close()
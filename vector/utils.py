@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 from pydub import AudioSegment
 import pickle
 import soundfile as sf
+from .index_file import open_index, write_index
 
 
 def get_statistics(tensor):
@@ -48,18 +49,149 @@ def get_dist(db,x):
     value, idx = torch.sort(dist)
     return value, idx
 
+def chunked_topk(dist_fn, n, k=10, chunk_size=16384, valid=None):
+    """
+    Running top-k over distances produced block by block.
+
+    ``dist_fn(start, end)`` returns the distances of rows ``start:end``.
+    Only one block of distances is alive at a time and each block is reduced
+    with a partial ``topk`` and merged into the current best k. Rows where
+    the bool mask ``valid`` is False are never returned. Returns the k
+    smallest distances in ascending order and their row indices.
+    """
+    k = min(k, n)
+    best_value, best_idx = None, None
+    for start in range(0, n, chunk_size):
+        dist = dist_fn(start, min(start+chunk_size, n))
+        if valid is not None:
+            dist = torch.where(valid[start:start+chunk_size].to(dist.device), dist, float('inf'))
+        value, idx = torch.topk(dist, min(k, dist.shape[0]), largest=False)
+        idx = idx + start
+        if best_value is not None:
+            value = torch.cat((best_value, value))
+            idx = torch.cat((best_idx, idx))
+            value, order = torch.topk(value, min(k, value.shape[0]), largest=False)
+            idx = idx[order]
+        best_value, best_idx = value, idx
+    if best_value is None:
+        return torch.empty(0), torch.empty(0, dtype=torch.long)
+    value, order = torch.sort(best_value)
+    idx = best_idx[order]
+    if valid is not None:
+        # valid row 가 k 개보다 적으면 inf 로 채워진 row 가 섞여 있음
+        value, idx = drop_invalid(value, idx, valid)
+    return value, idx
+
+SELECTIVE = 0.25
+
+def selective_rows(valid, ratio=SELECTIVE):
+    """Row ids of ``valid`` when at most ``ratio`` of the rows are valid, else None"""
+    if valid is None or valid.sum() > ratio * valid.shape[0]:
+        return None
+    return valid.nonzero().reshape(-1)
+
+def get_topk(db, x, k=10, chunk_size=16384, valid=None):
+    """
+    Chunked L1 top-k search.
+
+    Scans ``db`` in blocks of ``chunk_size`` rows, so at most one
+    ``chunk_size x D`` temporary is alive at a time and no full sort over N
+    distances is done. Same result as ``get_dist(db, x)[:k]``. When a
+    selective ``valid`` mask (e.g. a metadata filter) leaves few rows, only
+    those rows are gathered and scored.
+    """
+    x = x.reshape(1,-1)
+    ids = selective_rows(valid)
+    if ids is not None:
+        ids = ids.to(db.device)
+        value, idx = chunked_topk(lambda start, end: torch.sum(torch.abs(db[ids[start:end]]-x),dim=1),
+                                  len(ids), k, chunk_size)
+        return value, ids[idx]
+    return chunked_topk(lambda start, end: torch.sum(torch.abs(db[start:end]-x),dim=1),
+                        db.shape[0], k, chunk_size, valid)
+
+METRICS = ('cosine', 'ip', 'l1')
+
+def batch_topk(db, queries, k=10, metric='cosine', tile=16384, query_tile=256, valid=None):
+    """
+    Top-k rows of ``db`` for every row of ``queries`` (Q x D).
+
+    The Q x N score matrix is never materialised: queries are taken
+    ``query_tile`` at a time and db ``tile`` rows at a time, each block is
+    scored with one matrix multiplication (``cdist`` for l1) and merged into
+    a running per-row top-k. 'cosine' normalises both sides, 'ip' is the raw
+    inner product; for both the values are similarities in descending order.
+    'l1' returns distances in ascending order, as ``get_topk`` does.
+
+    Returns:
+        values, idx (torch.Tensor): Q x k. Rows masked out by ``valid`` are
+        never returned; when fewer than k rows are valid the tail of a row is
+        padded with -inf / inf.
+    """
+    assert metric in METRICS, f'metric must be one of {METRICS}'
+    n = db.shape[0]
+    k = min(k, n)
+    largest = metric != 'l1'
+    fill = float('-inf') if largest else float('inf')
+    queries = queries.reshape(-1, db.shape[1]).to(db.dtype)
+    if metric == 'cosine':
+        queries = torch.nn.functional.normalize(queries, dim=1)
+    if valid is not None:
+        valid = valid.to(db.device)
+
+    all_values, all_idx = [], []
+    for q_start in range(0, queries.shape[0], query_tile):
+        q = queries[q_start:q_start+query_tile].to(db.device)
+        best_value, best_idx = None, None
+        for start in range(0, n, tile):
+            block = db[start:start+tile]
+            if metric == 'l1':
+                score = torch.cdist(q, block, p=1)
+            else:
+                if metric == 'cosine':
+                    block = torch.nn.functional.normalize(block, dim=1)
+                score = q @ block.T
+            if valid is not None:
+                score = score.masked_fill(~valid[start:start+tile], fill)
+            value, idx = torch.topk(score, min(k, score.shape[1]), dim=1, largest=largest)
+            idx = idx + start
+            if best_value is not None:
+                value = torch.cat((best_value, value), dim=1)
+                idx = torch.cat((best_idx, idx), dim=1)
+                value, order = torch.topk(value, min(k, value.shape[1]), dim=1, largest=largest)
+                idx = idx.gather(1, order)
+            best_value, best_idx = value, idx
+        all_values.append(best_value)
+        all_idx.append(best_idx)
+    return torch.cat(all_values), torch.cat(all_idx)
+
+def batch_results(paths, values, idxs):
+    """[(paths, values)] per query row of a batch_topk result, padding rows dropped"""
+    results = []
+    for row_values, row_idx in zip(values, idxs):
+        keep = torch.isfinite(row_values)
+        results.append(([paths[i] for i in row_idx[keep].tolist()], list(row_values[keep])))
+    return results
+
+def drop_invalid(value, idx, valid):
+    """Remove rows masked out by ``valid`` from a (value, idx) result"""
+    if valid is None:
+        return value, idx
+    keep = valid.to(idx.device)[idx]
+    return value[keep], idx[keep]
+
 def load_weight(weight_path):
+    if os.path.exists(f'{weight_path}/index.bin'):
+        index = open_index(f'{weight_path}/index.bin')
+        return index.paths, index.vecs, index.stats[0], index.stats[1]
+    # 예전 형식 (paths.pkl + weight.pt)
     with open(f'{weight_path}/paths.pkl', 'rb') as f:
         paths = pickle.load(f)
     weight = torch.load(f'{weight_path}/weight.pt')
     return paths , weight[2:], weight[0], weight[1]
 
-def save_weight(weight_path,paths,weight,mean,std):
+def save_weight(weight_path,paths,weight,max_val,min_val):
     if not os.path.exists(weight_path):
         os.mkdir(weight_path)
-    with open(f'{weight_path}/paths.pkl', 'wb') as f:
-        pickle.dump(paths, f)
-    mean = mean.reshape(1,-1)
-    std = std.reshape(1,-1)
-    weight = torch.cat((mean,std,weight),dim=0)
-    torch.save(weight, f'{weight_path}/weight.pt')
\ No newline at end of file
+    stats = torch.stack((max_val.reshape(-1),min_val.reshape(-1)))
+    write_index(f'{weight_path}/index.bin',weight,paths,stats)
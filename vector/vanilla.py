@@ -1,84 +1,129 @@
 import numpy as np
 import librosa
 import torch
+from collections import defaultdict
+import scipy.fft
 
-def compute_fft_descriptors_cpu(path):
-    """CPU implementation of FFT descriptors"""
-    try:
-        y, sr = librosa.load(path, sr=None)
 
-    
-        # Compute FFT
-        fft = np.fft.rfft(y)
-        freqs = np.fft.rfftfreq(len(y), 1/sr)
+def _descriptors(amplitudes, freqs):
+    """f0/A/S/H/M/MA/MC for a B x F batch of rfft amplitudes on a shared frequency grid"""
+    n_bins = amplitudes.shape[1]
+    total = torch.sum(amplitudes, dim=1)
+    peak = torch.argmax(amplitudes, dim=1)
 
-        # Compute amplitudes
-        amplitudes = np.abs(fft)
+    # Fundamental frequency (f0) estimation
+    f0 = freqs[peak]
 
-        # Fundamental frequency (f0) estimation
-        f0 = freqs[np.argmax(amplitudes)]
+    # Affinity (A)
+    A = torch.mv(amplitudes, freqs) / (f0 * total)
 
-        # Affinity (A)
-        A = np.sum(amplitudes * freqs) / (f0 * np.sum(amplitudes))
+    # Sharpness (S)
+    S = amplitudes.gather(1, peak.unsqueeze(1)).squeeze(1) / total
 
-        # Sharpness (S)
-        S = amplitudes[np.argmax(amplitudes)] / np.sum(amplitudes)
+    # Harmonicity (H), B x F 임시 배열은 하나만 사용
+    # freqs / f0 로 나눠야 반올림 경계에서 기존 per-file 값과 같아짐 (역수 곱은 H 가 달라짐)
+    ratio = freqs.unsqueeze(0) / f0.unsqueeze(1)
+    ratio.sub_(torch.round(ratio))
+    H = torch.sum(ratio.mul_(amplitudes), dim=1) / total
 
-        # Harmonicity (H)
-        H = np.sum((freqs / f0 - np.round(freqs / f0)) * amplitudes) / np.sum(amplitudes)
+    # Monotony (M): rfft 주파수 간격이 일정하므로 diff 의 합은 양 끝의 차이
+    M = f0 / n_bins * (amplitudes[:, -1] - amplitudes[:, 0]) / (freqs[1] - freqs[0])
 
-        # Monotony (M)
-        M = f0 / len(amplitudes) * np.sum(np.diff(amplitudes) / np.diff(freqs))
+    # Mean Affinity (MA)
+    MA = torch.sum(torch.abs(freqs - torch.mean(freqs))) / (n_bins * f0)
 
-        # Mean Affinity (MA)
-        MA = np.sum(np.abs(freqs - np.mean(freqs))) / (len(freqs) * f0)
-
-        # Mean Contrast (MC)
-        MC = np.sum(np.abs(amplitudes[0] - amplitudes)) / len(amplitudes)
-
-        return torch.tensor([f0, A, S, H, M, MA, MC])
-    except:
-        return False
-
-@torch.no_grad()
-def compute_fft_descriptors_cuda(path):
-    """CUDA implementation of FFT descriptors"""
-    try:
-        y, sr = librosa.load(path, sr=None)
-
-    
-        # Move data to GPU
-        y = torch.from_numpy(y).cuda()
+    # Mean Contrast (MC)
+    MC = torch.sum(torch.abs(amplitudes - amplitudes[:, :1]), dim=1) / n_bins
 
-        # Compute FFT
-        fft = torch.fft.rfft(y)
-        freqs = torch.from_numpy(np.fft.rfftfreq(len(y), 1/sr)).cuda()
+    return torch.stack([f0, A, S, H, M, MA, MC], dim=1)
 
-        # Compute amplitudes
-        amplitudes = torch.abs(fft)
 
-        # Fundamental frequency (f0) estimation
-        f0 = freqs[torch.argmax(amplitudes)]
+def _descriptors_exact(y, sr):
+    """per-file formulation of the original compute_fft_descriptors_cpu (np.fft in the signal's precision)"""
+    amplitudes = np.abs(np.fft.rfft(y))
+    freqs = np.fft.rfftfreq(len(y), 1 / sr)
+    peak = np.argmax(amplitudes)
+    f0 = freqs[peak]
+    total = np.sum(amplitudes)
+    A = np.sum(amplitudes * freqs) / (f0 * total)
+    S = amplitudes[peak] / total
+    H = np.sum((freqs / f0 - np.round(freqs / f0)) * amplitudes) / total
+    M = f0 / len(amplitudes) * np.sum(np.diff(amplitudes) / np.diff(freqs))
+    MA = np.sum(np.abs(freqs - np.mean(freqs))) / (len(freqs) * f0)
+    MC = np.sum(np.abs(amplitudes[0] - amplitudes)) / len(amplitudes)
+    return torch.tensor([f0, A, S, H, M, MA, MC], dtype=torch.float64)
 
-        # Affinity (A)
-        A = torch.sum(amplitudes * freqs) / (f0 * torch.sum(amplitudes))
 
-        # Sharpness (S)
-        S = amplitudes[torch.argmax(amplitudes)] / torch.sum(amplitudes)
+@torch.no_grad()
+def fft_descriptors_batch(signals, srs, device='cpu', fast_len=False, max_bytes=1 << 28):
+    """
+    FFT descriptors for many decoded signals at once.
+
+    By default every signal is transformed at its exact length, which gives
+    the values existing fft indexes (and weight.pt) were built with. With
+    ``fast_len`` each signal is zero-padded to ``scipy.fft.next_fast_len`` of its own length, so a
+    length with large prime factors no longer makes the FFT slow, and the
+    result of one file does not depend on what else is in the batch.
+    Signals with the same padded length and sample rate are stacked and
+    transformed together (scipy.fft on cpu, torch.fft otherwise), and the
+    descriptors are computed for the whole block with torch ops.
+    ``max_bytes`` bounds each stacked block.
 
-        # Harmonicity (H)
-        H = torch.sum((freqs / f0 - torch.round(freqs / f0)) * amplitudes) / torch.sum(amplitudes)
+    Args:
+        signals (list): 1-D numpy arrays
+        srs (list or int): sample rate per signal
+        device (str): torch device to run on
+        fast_len (bool): pad to an FFT-friendly length. The descriptors
+            differ from the exact-length ones (H and M most), so an index and
+            its queries must use the same setting. False (default) reproduces
+            the original per-file numbers bit for bit (np.fft, no batching)
 
-        # Monotony (M)
-        M = f0 / len(amplitudes) * torch.sum(torch.diff(amplitudes) / torch.diff(freqs))
+    Returns:
+        torch.Tensor: B x 7 float64 on cpu. Rows are nan/inf where the
+        descriptors are undefined (e.g. silence), like the per-file version.
+    """
+    if isinstance(srs, (int, float)):
+        srs = [srs] * len(signals)
+    out = torch.empty((len(signals), 7), dtype=torch.float64)
+    if not fast_len:
+        for i, (y, sr) in enumerate(zip(signals, srs)):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out[i] = _descriptors_exact(y, sr)
+        return out
+    groups = defaultdict(list)
+    for i, (y, sr) in enumerate(zip(signals, srs)):
+        n = scipy.fft.next_fast_len(len(y), real=True)
+        groups[(n, sr)].append(i)
+
+    for (n, sr), idx in groups.items():
+        freqs = torch.fft.rfftfreq(n, 1 / sr, dtype=torch.float64, device=device)
+        rows = max(1, max_bytes // (n * 8 * 3))
+        for start in range(0, len(idx), rows):
+            block = idx[start:start + rows]
+            batch = np.zeros((len(block), n), dtype=np.float64)
+            for row, i in enumerate(block):
+                batch[row, :len(signals[i])] = signals[i]
+            if torch.device(device).type == 'cpu':
+                amplitudes = torch.from_numpy(np.abs(scipy.fft.rfft(batch, axis=1, workers=-1)))
+            else:
+                amplitudes = torch.abs(torch.fft.rfft(torch.from_numpy(batch).to(device), dim=1))
+            out[block] = _descriptors(amplitudes, freqs).cpu()
+    return out
 
-        # Mean Affinity (MA)
-        MA = torch.sum(torch.abs(freqs - torch.mean(freqs))) / (len(freqs) * f0)
 
-        # Mean Contrast (MC)
-        MC = torch.sum(torch.abs(amplitudes[0] - amplitudes)) / len(amplitudes)
+def compute_fft_descriptors_cpu(path):
+    """CPU implementation of FFT descriptors"""
+    try:
+        y, sr = librosa.load(path, sr=None)
+        return fft_descriptors_batch([y], [sr])[0]
+    except:
+        return False
 
-        return torch.tensor([f0, A, S, H, M, MA, MC]).detach()
+def compute_fft_descriptors_cuda(path):
+    """CUDA implementation of FFT descriptors"""
+    try:
+        y, sr = librosa.load(path, sr=None)
+        return fft_descriptors_batch([y], [sr], device='cuda')[0]
     except:
         return False
 
@@ -95,4 +140,3 @@ def compute_fft_descriptors(path, use_cuda=True):
     """
 
     return compute_fft_descriptors_cpu(path)
-